@@ -0,0 +1,222 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from profiling import PhaseProfiler
+
+SIZES = (200, 2000, 20000, 100000)
+ENGINES = ("agents", "array")
+
+# What a headless worker runs before its first tick, each timed in a fresh interpreter
+STARTUP_CASES = {
+    "import epidemic_sim": "import epidemic_sim",
+    "import population": "import population",
+    "import ensemble": "import ensemble",
+    "array worker": "from population import ArrayPopulation; ArrayPopulation(2000, 100, seed=0).step()",
+}
+# Heavy modules that only the window, the plots and the CSV loaders need; none of the cases may load them
+DEFERRED_MODULES = ("pygame", "matplotlib", "pandas")
+STARTUP_PROBE = """
+import json, resource, sys, time, types
+start = time.perf_counter()
+exec(sys.argv[1])
+seconds = time.perf_counter() - start
+scale = 1 if sys.platform == "darwin" else 1024
+print(json.dumps({"seconds": seconds, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20,
+                  "loaded": [name for name in sys.argv[2:] if type(sys.modules.get(name)) is types.ModuleType]}))
+"""
+
+
+def build(engine, num_agents, seed):
+    """Seeded population with 5% of the agents infected, in a world at the default agent density.
+
+    Only the agent count varies between sizes, so the timings measure scaling rather than crowding.
+    """
+    from population import ArrayPopulation, world_size
+    num_infected = max(1, num_agents // 20)
+    width, height = world_size(num_agents)
+    if engine == "agents":
+        from epidemic_sim import Simulation
+        return Simulation(num_agents, num_infected, seed=seed, width=width, height=height)
+    return ArrayPopulation(num_agents, num_infected, width, height, seed=seed)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def run_case(engine, num_agents, ticks, warmup, seed, max_seconds=None):
+    """Time every phase of `ticks` headless ticks of one seeded population.
+
+    With max_seconds set, the case stops after the first tick that ends past the budget and reports the
+    ticks it managed, so slow engines at large sizes still produce a ticks/sec figure.
+    """
+    start = time.perf_counter()
+    simulation = build(engine, num_agents, seed)
+    build_seconds = time.perf_counter() - start
+
+    simulation.step(warmup)
+
+    simulation.profiler = PhaseProfiler(window=ticks)
+    start = time.perf_counter()
+    completed = 0
+    while completed < ticks:
+        simulation.step()
+        completed += 1
+        if max_seconds is not None and time.perf_counter() - start > max_seconds:
+            break
+    total = time.perf_counter() - start
+    phases = simulation.profiler.summary()
+
+    return {
+        "engine": engine,
+        "agents": num_agents,
+        "ticks": completed,
+        "build_seconds": build_seconds,
+        "total_seconds": total,
+        "ticks_per_second": completed / total if total else float("inf"),
+        "phase_ms_per_tick": {name: phases[name]["total_ms"] / completed for name in simulation.PHASES},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_isolated(engine, num_agents, ticks, warmup, seed, max_seconds=None):
+    """Run one case in a fresh process, so peak memory belongs to that case alone."""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_case, (engine, num_agents, ticks, warmup, seed, max_seconds))
+
+
+def run_startup(name, statement, repeat):
+    """Best of repeat fresh interpreters running one startup case: the time spent in the statement, the
+    whole process wall time, peak memory and which deferred modules it ended up loading."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", STARTUP_PROBE, statement, *DEFERRED_MODULES],
+                                   capture_output=True, text=True, check=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        run = json.loads(completed.stdout.strip().splitlines()[-1])
+        run["process_seconds"] = time.perf_counter() - start
+        runs.append(run)
+    best = min(runs, key=lambda run: run["process_seconds"])
+    return {"case": name, "seconds": min(run["seconds"] for run in runs),
+            "process_seconds": best["process_seconds"], "peak_rss_mb": min(run["peak_rss_mb"] for run in runs),
+            "loaded": best["loaded"]}
+
+
+def print_startup(result, baseline=None):
+    line = (f"{result['case']:<20}{result['seconds'] * 1000:>10.1f}{result['process_seconds'] * 1000:>12.1f}"
+            f"{result['peak_rss_mb']:>10.1f}")
+    if result["loaded"]:
+        line += f"  loads {', '.join(result['loaded'])}!"
+    if baseline:
+        line += f"  [{baseline['process_seconds'] / result['process_seconds']:.2f}x vs baseline]"
+    print(line)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def environment():
+    import numpy
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def print_header():
+    print(f"{'engine':<8}{'agents':>9}{'ticks/s':>12}{'peak MB':>10}  slowest phases (ms/tick)")
+
+
+def print_result(result, baseline=None):
+    slowest = sorted(result["phase_ms_per_tick"].items(), key=lambda item: -item[1])[:3]
+    line = (f"{result['engine']:<8}{result['agents']:>9}{result['ticks_per_second']:>12.1f}"
+            f"{result['peak_rss_mb']:>10.1f}  " + ", ".join(f"{name} {ms:.2f}" for name, ms in slowest))
+    if baseline:
+        line += f"  [{result['ticks_per_second'] / baseline['ticks_per_second']:.2f}x vs baseline]"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-tick hot paths headless.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--engines", choices=ENGINES, nargs="+", default=ENGINES)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--max-seconds", type=float, default=60.0,
+                        help="time budget per case; slow cases stop early and report the ticks they ran")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier JSON results to report speedups against")
+    parser.add_argument("--startup", action="store_true",
+                        help="time headless startup (imports and first tick) instead of the tick phases")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per startup case")
+    args = parser.parse_args()
+
+    if args.startup:
+        return startup_main(args)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as previous:
+            baseline = {(r["engine"], r["agents"]): r for r in json.load(previous)["results"]}
+
+    results = []
+    print_header()
+    for engine in args.engines:
+        for size in args.sizes:
+            result = run_isolated(engine, size, args.ticks, args.warmup, args.seed, args.max_seconds)
+            print_result(result, baseline.get((engine, size)))
+            results.append(result)
+
+    report = {"environment": environment(), "ticks": args.ticks, "seed": args.seed, "results": results}
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def startup_main(args):
+    """Startup benchmark; exits with status 1 if a case loads one of DEFERRED_MODULES."""
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as previous:
+            baseline = {r["case"]: r for r in json.load(previous).get("startup", [])}
+
+    results = []
+    print(f"{'case':<20}{'ms':>10}{'process ms':>12}{'peak MB':>10}")
+    for name, statement in STARTUP_CASES.items():
+        result = run_startup(name, statement, args.repeat)
+        print_startup(result, baseline.get(name))
+        results.append(result)
+
+    report = {"environment": environment(), "startup": results}
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+    if any(result["loaded"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from data import CACHE_FILEPATH, daily_case_series, region
+from ensemble import ENGINES, build_replicate, replicate_seeds
+from epidemic_sim import FPS, no_agents, no_infected
+
+# Calibrated parameters and the ranges searched by default
+SEARCH_SPACE = {
+    "infection_probability": (0.05, 0.8),
+    "recovery_probability": (0.5, 1.0),
+    "vaccination_succes_probability": (0.3, 1.0),
+    "infection_radius": (10, 60),
+    "repel_radius": (5, 30),
+    "grouping_radius": (30, 150),
+}
+# Parameters the simulation treats as pixel distances
+INTEGER_PARAMETERS = {"infection_radius", "repel_radius", "grouping_radius"}
+
+# Simulated counters compared with the observed Confirmed, Recovered and Deaths columns
+OBSERVED_COLUMNS = ("Confirmed", "Recovered", "Deaths")
+COUNTER_FIELDS = ("infection_rate", "recovery_rate", "death_count")
+
+CALIBRATION_CACHE = os.path.join(os.path.dirname(CACHE_FILEPATH), "calibration.jsonl")
+
+
+def observed_curve(selected_region=region, num_infected=no_infected, scale=None, days=None):
+    """Cumulative Confirmed, Recovered and Deaths of a region in agents, from its first confirmed case on.
+
+    scale is the number of agents per reported case; by default the initially infected agents stand for
+    the cases confirmed on the first day.
+    """
+    daily = daily_case_series(selected_region)
+    cumulative = daily[list(OBSERVED_COLUMNS)].cumsum().to_numpy(dtype=float)
+    started = np.flatnonzero(cumulative[:, 0] > 0)
+    if len(started) == 0:
+        raise ValueError(f"No confirmed cases for {selected_region}")
+    cumulative = cumulative[started[0]:]
+    if days is not None:
+        cumulative = cumulative[:days + 1]
+    if scale is None:
+        scale = num_infected / cumulative[0, 0]
+    return cumulative * scale
+
+
+def evaluate(parameters, seed, observed, ticks_per_day, num_agents, num_infected, engine, threshold=math.inf):
+    """Score one seeded run against an observed curve, stopping early once it cannot beat threshold.
+
+    The score is the root mean square difference, as a fraction of the population, between the simulated
+    and observed cumulative counts at the end of every day after the first. Squared errors only add up,
+    so a run is abandoned as soon as the error so far already puts its score above threshold; the score
+    it returns is then a lower bound, and stopped the number of days it ran.
+    """
+    simulation = build_replicate(parameters, seed, num_agents, num_infected, engine)
+    target = observed[1:] / num_agents
+    limit = threshold ** 2 * target.size
+    total = 0.0
+    for day, expected in enumerate(target):
+        simulation.step(ticks_per_day)
+        simulated = np.array([getattr(simulation.counters, field) for field in COUNTER_FIELDS], dtype=float)
+        simulated = simulated.reshape(len(COUNTER_FIELDS)) / num_agents
+        total += float(((simulated - expected) ** 2).sum())
+        if total > limit:
+            return {"score": math.sqrt(total / target.size), "stopped": day + 1}
+    return {"score": math.sqrt(total / max(target.size, 1)), "stopped": None}
+
+
+class CalibrationCache:
+    """Evaluations memoized in an append-only JSON lines file.
+
+    Each finished run is written out immediately, so a calibration that crashed or was interrupted
+    picks up where it stopped. Runs that were stopped early are only reused while they would still be
+    stopped under the current threshold.
+    """
+
+    def __init__(self, path=CALIBRATION_CACHE):
+        self.path = path
+        self.results = {}
+        if path and os.path.exists(path):
+            with open(path) as cache:
+                for line in cache:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    self.results[entry["key"]] = entry["result"]
+
+    @staticmethod
+    def key(parameters, replicate, setup):
+        text = json.dumps({"parameters": parameters, "replicate": replicate, **setup}, sort_keys=True)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def get(self, key, threshold=math.inf):
+        result = self.results.get(key)
+        if result is None or (result["stopped"] is not None and result["score"] <= threshold):
+            return None
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as cache:
+                cache.write(json.dumps({"key": key, "result": result}) + "\n")
+
+
+class Calibration:
+    """Scores parameter sets of the headless model against one region's observed epidemic.
+
+    Every candidate runs replicates seeded runs across a process pool and scores the mean of their
+    scores. A run is stopped early once its error exceeds stop_factor times the best score found so far,
+    and candidates with a stopped run rank after every fully evaluated one.
+    """
+
+    def __init__(self, selected_region=region, num_agents=no_agents, num_infected=no_infected, replicates=3,
+                 ticks_per_day=FPS, scale=None, days=None, base_seed=0, engine="agents", workers=None,
+                 stop_factor=2.0, cache_path=CALIBRATION_CACHE):
+        self.observed = observed_curve(selected_region, num_infected, scale, days)
+        self.num_agents = num_agents
+        self.num_infected = num_infected
+        self.replicates = replicates
+        self.ticks_per_day = ticks_per_day
+        self.seeds = replicate_seeds(base_seed, replicates)
+        self.engine = engine
+        self.workers = workers or os.cpu_count()
+        self.stop_factor = stop_factor
+        self.cache = CalibrationCache(cache_path)
+        self.setup = {
+            "observed": hashlib.sha1(self.observed.tobytes()).hexdigest(), "agents": num_agents,
+            "infected": num_infected, "ticks_per_day": ticks_per_day, "base_seed": base_seed, "engine": engine,
+        }
+        self.results = []
+
+    @property
+    def best(self):
+        return self.results[0] if self.results else None
+
+    def threshold(self):
+        finished = [result["score"] for result in self.results if not result["stopped"]]
+        return min(finished) * self.stop_factor if finished else math.inf
+
+    def evaluate(self, candidates):
+        """Score a batch of parameter dicts, reusing memoized runs, and return the updated ranking."""
+        candidates = [normalize(parameters) for parameters in candidates]
+        runs = {i: [None] * self.replicates for i in range(len(candidates))}
+        pending = [(i, replicate, seed) for i in range(len(candidates)) for replicate, seed in enumerate(self.seeds)]
+        pending.reverse()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {}
+            while pending or futures:
+                # Runs are handed out only as workers free up, so each starts with the best threshold known
+                while pending and len(futures) < self.workers:
+                    i, replicate, seed = pending.pop()
+                    key = self.cache.key(candidates[i], replicate, self.setup)
+                    threshold = self.threshold()
+                    cached = self.cache.get(key, threshold)
+                    if cached is not None:
+                        runs[i][replicate] = cached
+                        self.add_finished(candidates, runs, i)
+                        continue
+                    future = pool.submit(evaluate, candidates[i], seed, self.observed, self.ticks_per_day,
+                                         self.num_agents, self.num_infected, self.engine, threshold)
+                    futures[future] = (i, replicate, key)
+
+                if futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i, replicate, key = futures.pop(future)
+                        runs[i][replicate] = result = future.result()
+                        self.cache.put(key, result)
+                        self.add_finished(candidates, runs, i)
+        return self.results
+
+    def add_finished(self, candidates, runs, i):
+        """Rank candidate i once all of its runs are in."""
+        if runs[i] is None or any(run is None for run in runs[i]):
+            return
+        self.results.append({
+            "parameters": candidates[i],
+            "score": float(np.mean([run["score"] for run in runs[i]])),
+            "stopped": any(run["stopped"] for run in runs[i]),
+        })
+        self.results.sort(key=lambda result: (result["stopped"], result["score"]))
+        runs[i] = None
+
+    def grid(self, values):
+        """Evaluate every combination of a dict of parameter name -> list of values."""
+        names = list(values)
+        return self.evaluate([dict(zip(names, combination))
+                              for combination in itertools.product(*(values[name] for name in names))])
+
+    def adaptive(self, bounds=None, rounds=4, batch=16, shrink=0.5, seed=0):
+        """Random search that narrows the ranges around the best candidate after every round.
+
+        Candidates are drawn from a seeded generator and the ranking is deterministic, so a rerun draws
+        the same candidates and finds their runs in the cache.
+        """
+        space = dict(bounds or SEARCH_SPACE)
+        bounds = dict(space)
+        rng = np.random.default_rng(seed)
+        for _ in range(rounds):
+            self.evaluate([{name: rng.uniform(low, high) for name, (low, high) in bounds.items()}
+                           for _ in range(batch)])
+            best = self.best["parameters"]
+            for name, (low, high) in bounds.items():
+                half = (high - low) * shrink / 2
+                start, stop = space[name]
+                center = min(max(best[name], start + half), stop - half)
+                bounds[name] = (center - half, center + half)
+        return self.results
+
+
+def normalize(parameters):
+    """Plain, rounded parameter values so equal candidates share a cache key."""
+    return {name: int(round(value)) if name in INTEGER_PARAMETERS else round(float(value), 6)
+            for name, value in sorted(parameters.items())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the model against a region's observed epidemic.")
+    parser.add_argument("--region", default=region)
+    parser.add_argument("--search", choices=("grid", "adaptive"), default="adaptive")
+    parser.add_argument("--agents", type=int, default=no_agents)
+    parser.add_argument("--infected", type=int, default=no_infected)
+    parser.add_argument("--replicates", type=int, default=3)
+    parser.add_argument("--ticks-per-day", type=int, default=FPS)
+    parser.add_argument("--days", type=int, default=None)
+    parser.add_argument("--scale", type=float, default=None, help="agents per reported case")
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--grid-points", type=int, default=3)
+    parser.add_argument("--stop-factor", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", choices=ENGINES, default="agents")
+    parser.add_argument("--cache", default=CALIBRATION_CACHE)
+    args = parser.parse_args()
+
+    calibration = Calibration(args.region, args.agents, args.infected, args.replicates, args.ticks_per_day,
+                              args.scale, args.days, args.seed, args.engine, args.workers, args.stop_factor,
+                              args.cache)
+    if args.search == "grid":
+        calibration.grid({name: np.linspace(low, high, args.grid_points) for name, (low, high) in SEARCH_SPACE.items()})
+    else:
+        calibration.adaptive(rounds=args.rounds, batch=args.batch, seed=args.seed)
+
+    for result in calibration.results[:5]:
+        flag = " (stopped early)" if result["stopped"] else ""
+        print(f"{result['score']:.4f}{flag} {result['parameters']}")
+
+
+if __name__ == "__main__":
+    main()
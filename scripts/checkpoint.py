@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+
+from recorder import StatsRecorder
+
+MAGIC = b"EPICKPT1"
+# Array blocks start on this boundary so every one of them can be memory-mapped in place
+ALIGNMENT = 64
+
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(path, meta, arrays):
+    """Write JSON-able metadata and a dict of named arrays to one binary file.
+
+    The file is the magic bytes, the header length, a JSON header (the metadata plus dtype, shape and
+    offset of every array) and then the raw array blocks, so writing costs one tofile() per array.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = aligned(offset)
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+
+    header = json.dumps({"meta": meta, "arrays": layout}).encode()
+    start = aligned(len(MAGIC) + 8 + len(header))
+    with open(path, "wb") as snapshot:
+        snapshot.write(MAGIC)
+        snapshot.write(len(header).to_bytes(8, "little"))
+        snapshot.write(header)
+        for name, array in arrays.items():
+            snapshot.seek(start + layout[name]["offset"])
+            array.tofile(snapshot)
+
+
+def read_snapshot(path, mmap=True):
+    """Read a file written by write_snapshot and return (meta, arrays).
+
+    With mmap the arrays are read-only memory maps into the file, so only the parts that are actually
+    touched get read from disk.
+    """
+    with open(path, "rb") as snapshot:
+        if snapshot.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a simulation checkpoint: {path}")
+        length = int.from_bytes(snapshot.read(8), "little")
+        header = json.loads(snapshot.read(length))
+    start = aligned(len(MAGIC) + 8 + length)
+
+    arrays = {}
+    for name, block in header["arrays"].items():
+        dtype, shape = np.dtype(block["dtype"]), tuple(block["shape"])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=start + block["offset"], shape=shape)
+        else:
+            arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)),
+                                       offset=start + block["offset"]).reshape(shape)
+    return header["meta"], arrays
+
+
+def recorder_snapshot(recorder):
+    """Metadata and recorded rows of a StatsRecorder."""
+    meta = {"sample_every": recorder.sample_every, "tick": recorder.tick, "counts": recorder.counts}
+    return meta, np.asarray(recorder.table())
+
+
+def restore_recorder(meta, table, stats_path=None):
+    """Rebuild a StatsRecorder holding the rows of table, spilling to stats_path from now on if given."""
+    recorder = StatsRecorder(meta["sample_every"], capacity=max(len(table), 1024), spill_path=stats_path)
+    if stats_path:
+        with open(stats_path, "ab") as spill:
+            np.asarray(table, dtype=np.int64).tofile(spill)
+        recorder.spilled = len(table)
+    else:
+        recorder.rows[:len(table)] = table
+        recorder.size = len(table)
+    recorder.tick = meta["tick"]
+    recorder.counts = dict(meta["counts"])
+    return recorder
+
+
+def python_rng_state(rng):
+    """State of a random.Random as (metadata, array of its Mersenne Twister words)."""
+    version, words, gauss_next = rng.getstate()
+    return {"version": version, "gauss_next": gauss_next}, np.array(words, dtype=np.uint32)
+
+
+def restore_python_rng(rng, meta, words):
+    rng.setstate((meta["version"], tuple(int(word) for word in words), meta["gauss_next"]))
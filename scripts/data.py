@@ -1,55 +1,32 @@
-import pandas as pd
+import os
+import tempfile
+import zipfile
+from functools import lru_cache
 
-region = 'France'
+import numpy as np
 
-def load_and_filter_data_by_region(epidemic_filepath, vaccination_filepath, population_filepath, region):
-    try:
-        epidemic_data = pd.read_csv(epidemic_filepath)
-        epidemic_region_data = epidemic_data[epidemic_data['Country/Region'] == region]
+from lazy import lazy_import
 
-        vaccination_data = pd.read_csv(vaccination_filepath)
-        vax_region_data = vaccination_data[vaccination_data['location'] == region ]
-    
-        population_data = pd.read_csv(population_filepath)
-        population_region_data = population_data[population_data['Country/Territory'] == region ]
-   
-        return epidemic_region_data, vax_region_data, population_region_data
-    except FileNotFoundError:
-        print("File not found. Please provide the correct file path.")
-        return None, None, None
+# Deferred until a CSV is actually read; the cached region table is plain NumPy
+pd = lazy_import("pandas")
 
-def calculate_infection_and_recovery_rates(region_data):
-    confirmed = region_data[region_data['Case Type'] == 'Confirmed']
-    recovered = region_data[region_data['Case Type'] == 'Recovered']
-    deaths = region_data[region_data['Case Type'] == 'Deaths']
-    
-    total_confirmed_cases = confirmed['Count'].sum()
-    total_recovered_cases = recovered['Count'].sum()
-    total_deaths = deaths['Count'].sum()
-    
-    total_cases = total_confirmed_cases + total_recovered_cases + total_deaths
-    
-    infection_rate = total_confirmed_cases / total_cases 
-    recovery_rate = total_recovered_cases / total_confirmed_cases 
-    
-    return infection_rate, recovery_rate
+region = 'France'
 
-def calculate_vaccination_rate(vaccination_data, region_population, region_name):
-    
-    try:    
-        vaccinated = vaccination_data['people_vaccinated'].max()
-        
-        if region_population.empty:
-            print(f"Population data for {region_name} not found.")
-            return None
-        
-        average_population = (region_population['2020 Population'].iloc[0] + region_population['2022 Population'].iloc[0]) / 2
-        
-        vaccination_rate = vaccinated / average_population
-        return vaccination_rate
-    except KeyError:
-        print("Required columns missing in vaccination or population data.")
-        return None
+EPIDEMIC_FILEPATH = os.path.join('datasets', 'coronavirus_epidemic_dataset.csv')
+VACCINATION_FILEPATH = os.path.join('datasets', 'vaccination_dataset.csv')
+POPULATION_FILEPATH = os.path.join('datasets', 'world_population_dataset.csv')
+
+# Preprocessed per-region rates, rebuilt whenever one of the source CSVs changes
+CACHE_FILEPATH = os.path.join('datasets', '.cache', 'region_rates.npz')
+
+def daily_case_series(selected_region=region, epidemic_filepath=EPIDEMIC_FILEPATH):
+    """New Confirmed, Recovered and Deaths per day of a region, summed over its provinces, oldest first."""
+    epidemic_data = read_optional_csv(epidemic_filepath, ['Case Type', 'Count', 'Date', 'Country/Region'])
+    region_data = epidemic_data[epidemic_data['Country/Region'] == selected_region]
+    daily = region_data.pivot_table(index='Date', columns='Case Type', values='Count', aggfunc='sum')
+    daily = daily.reindex(columns=['Confirmed', 'Recovered', 'Deaths'], fill_value=0).fillna(0)
+    daily.index = pd.to_datetime(daily.index, format='%m/%d/%Y')
+    return daily.sort_index()
 
 def display_rates(region, infection_rate, recovery_rate, vaccination_rate):
     if infection_rate is not None:
@@ -67,21 +44,142 @@ def display_rates(region, infection_rate, recovery_rate, vaccination_rate):
     else:
         print(f"Vaccination rate for {region}: Data not available.")
 
-def extract_probabilities(epidemic_filepath='datasets\\coronavirus_epidemic_dataset.csv', 
-                          vaccination_filepath='datasets\\vaccination_dataset.csv', 
-                          population_filepath = 'datasets\\world_population_dataset.csv',
-                          selected_region=region):
+def source_signature(*filepaths):
+    """Identify the current version of the source files by path, size and modification time."""
+    signature = []
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+            signature.append(f"{filepath}:{stat.st_size}:{stat.st_mtime_ns}")
+        except FileNotFoundError:
+            signature.append(f"{filepath}:missing")
+    return tuple(signature)
+
+def read_optional_csv(filepath, columns):
+    try:
+        return pd.read_csv(filepath, usecols=columns)
+    except FileNotFoundError:
+        print(f"File not found: {filepath}. Rates depending on it will be unavailable.")
+        return pd.DataFrame(columns=columns)
+
+def build_region_table(epidemic_filepath, vaccination_filepath, population_filepath):
+    """Compute infection, recovery and vaccination rates for every region in one grouped pass.
 
-    infection_rate = None
-    recovery_rate = None
-    vaccination_rate = None
+    The infection rate is Confirmed over all cases, the recovery rate Recovered over Confirmed and the
+    vaccination rate the most people vaccinated over the mean of the 2020 and 2022 populations.
+    Rates that cannot be computed for a region are NaN.
+    """
+    epidemic_data = read_optional_csv(epidemic_filepath, ['Case Type', 'Count', 'Country/Region'])
+    vaccination_data = read_optional_csv(vaccination_filepath, ['location', 'people_vaccinated'])
+    population_data = read_optional_csv(population_filepath, ['Country/Territory', '2020 Population', '2022 Population'])
 
-    epidemic_region_data , vax_region_data, population_region_data = load_and_filter_data_by_region(epidemic_filepath, vaccination_filepath, population_filepath, selected_region)
+    totals = epidemic_data.pivot_table(index='Country/Region', columns='Case Type', values='Count', aggfunc='sum')
+    totals = totals.reindex(columns=['Confirmed', 'Recovered', 'Deaths'], fill_value=0).fillna(0)
+    vaccinated = vaccination_data.groupby('location')['people_vaccinated'].max()
+    population = population_data.set_index('Country/Territory')
+    average_population = (population['2020 Population'] + population['2022 Population']) / 2
+    average_population = average_population[~average_population.index.duplicated()]
+
+    regions = totals.index.union(vaccinated.index).union(average_population.index)
+    totals = totals.reindex(regions)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        infection_rate = totals['Confirmed'] / (totals['Confirmed'] + totals['Recovered'] + totals['Deaths'])
+        recovery_rate = totals['Recovered'] / totals['Confirmed']
+        vaccination_rate = vaccinated.reindex(regions) / average_population.reindex(regions)
+
+    return {
+        'regions': np.asarray(regions, dtype=str),
+        'infection_rate': infection_rate.to_numpy(dtype=float),
+        'recovery_rate': recovery_rate.to_numpy(dtype=float),
+        'vaccination_rate': vaccination_rate.to_numpy(dtype=float),
+    }
+
+def load_region_table(epidemic_filepath=EPIDEMIC_FILEPATH, vaccination_filepath=VACCINATION_FILEPATH,
+                      population_filepath=POPULATION_FILEPATH, cache_filepath=CACHE_FILEPATH):
+    """Return the per-region rate table, reading the on-disk cache when it matches the sources."""
+    signature = source_signature(epidemic_filepath, vaccination_filepath, population_filepath)
+    return _cached_region_table(epidemic_filepath, vaccination_filepath, population_filepath, cache_filepath, signature)
+
+@lru_cache(maxsize=8)
+def _cached_region_table(epidemic_filepath, vaccination_filepath, population_filepath, cache_filepath, signature):
+    try:
+        with np.load(cache_filepath) as cached:
+            if tuple(cached['signature']) == signature:
+                table = {name: cached[name] for name in ('regions', 'infection_rate', 'recovery_rate', 'vaccination_rate')}
+                table['index'] = {name: i for i, name in enumerate(table['regions'])}
+                return table
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        # A missing or corrupt cache (a crash mid-write, say) is rebuilt like a stale one
+        pass
+
+    table = build_region_table(epidemic_filepath, vaccination_filepath, population_filepath)
+    write_region_cache(cache_filepath, signature, table)
+
+    table['index'] = {name: i for i, name in enumerate(table['regions'])}
+    return table
+
+def write_region_cache(cache_filepath, signature, table):
+    """Write the cache beside its final path and rename it into place, so readers never see a partial file."""
+    directory = os.path.dirname(cache_filepath) or '.'
+    temporary = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.npz', delete=False) as file:
+            temporary = file.name
+            np.savez(file, signature=np.asarray(signature, dtype=str), **table)
+        os.replace(temporary, cache_filepath)
+    except OSError:
+        print(f"Could not write region cache to {cache_filepath}.")
+        if temporary is not None and os.path.exists(temporary):
+            os.remove(temporary)
+
+@lru_cache(maxsize=512)
+def _lookup_region(table_key, selected_region):
+    table = _cached_region_table(*table_key)
+    i = table['index'].get(selected_region)
+    if i is None:
+        return None, None, None
+    return tuple(None if np.isnan(table[name][i]) else float(table[name][i])
+                 for name in ('infection_rate', 'recovery_rate', 'vaccination_rate'))
+
+def region_probabilities(selected_region=region, epidemic_filepath=EPIDEMIC_FILEPATH,
+                         vaccination_filepath=VACCINATION_FILEPATH, population_filepath=POPULATION_FILEPATH,
+                         cache_filepath=CACHE_FILEPATH):
+    """Cached (infection_rate, recovery_rate, vaccination_rate) of a region, None where unavailable."""
+    signature = source_signature(epidemic_filepath, vaccination_filepath, population_filepath)
+    return _lookup_region((epidemic_filepath, vaccination_filepath, population_filepath, cache_filepath, signature),
+                          selected_region)
+
+@lru_cache(maxsize=8)
+def region_population(selected_region=region, population_filepath=POPULATION_FILEPATH, column='2022 Population'):
+    """Head count of a region from the world population dataset, None where unavailable."""
+    population_data = read_optional_csv(population_filepath, ['Country/Territory', column])
+    population = population_data.loc[population_data['Country/Territory'] == selected_region, column]
+    return int(population.iloc[0]) if len(population) else None
+
+@lru_cache(maxsize=8)
+def region_demographics(selected_region=region, population_filepath=POPULATION_FILEPATH):
+    """Population, area (km²), density (per km²) and yearly growth rate of a region, None where unavailable."""
+    columns = {'2022 Population': 'population', 'Area (km²)': 'area', 'Density (per km²)': 'density',
+               'Growth Rate': 'growth_rate'}
+    population_data = read_optional_csv(population_filepath, ['Country/Territory', *columns])
+    row = population_data.loc[population_data['Country/Territory'] == selected_region]
+    if not len(row):
+        return None
+    return {name: float(row[column].iloc[0]) for column, name in columns.items()}
+
+def available_regions(**filepaths):
+    """Every region that has at least one rate in the datasets."""
+    return list(load_region_table(**filepaths)['regions'])
+
+def extract_probabilities(epidemic_filepath=EPIDEMIC_FILEPATH, 
+                          vaccination_filepath=VACCINATION_FILEPATH, 
+                          population_filepath = POPULATION_FILEPATH,
+                          selected_region=region):
 
-    if epidemic_region_data is not None and vax_region_data is not None and population_region_data is not None:
-        infection_rate, recovery_rate = calculate_infection_and_recovery_rates(epidemic_region_data)
-        vaccination_rate = calculate_vaccination_rate(vax_region_data, population_region_data, selected_region)
-        display_rates(selected_region, infection_rate, recovery_rate, vaccination_rate)
+    infection_rate, recovery_rate, vaccination_rate = region_probabilities(
+        selected_region, epidemic_filepath, vaccination_filepath, population_filepath)
+    display_rates(selected_region, infection_rate, recovery_rate, vaccination_rate)
 
     return infection_rate, recovery_rate, vaccination_rate
 
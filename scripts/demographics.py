@@ -0,0 +1,227 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+import epidemic_sim as defaults
+from data import region, region_demographics
+from epidemic_sim import SimulationConfig
+from population import INFECTED, SUSCEPTIBLE, ArrayPopulation, world_size
+from tiling import TiledPopulation
+
+# Oldest age drawn; the stable age structure below ignores mortality before it
+MAX_AGE = 90
+# Rows of cells of the default density map; the columns follow the world's aspect ratio
+DENSITY_ROWS = 64
+
+
+class Stratum:
+    """One age or risk group of a generated population.
+
+    ages is its age range in years and recovery_duration the range its infections last, in simulated
+    seconds. risk scales the chance of dying of an infection, 1 - config.recovery_probability, and is
+    capped at certain death. vaccination_rate replaces the configured one for the stratum when set, and
+    share fixes its part of the population instead of deriving it from the region's growth rate.
+    """
+
+    def __init__(self, name, ages=(0, MAX_AGE), recovery_duration=(5, 10), risk=1.0, vaccination_rate=None,
+                 share=None):
+        self.name = name
+        self.ages = ages
+        self.recovery_duration = recovery_duration
+        self.risk = risk
+        self.vaccination_rate = vaccination_rate
+        self.share = share
+
+
+# Example age strata: younger agents recover sooner and die less often, older ones the reverse
+AGE_STRATA = (
+    Stratum("0-19", ages=(0, 20), recovery_duration=(4, 8), risk=0.2),
+    Stratum("20-64", ages=(20, 65), recovery_duration=(5, 10), risk=1.0),
+    Stratum("65+", ages=(65, MAX_AGE), recovery_duration=(7, 14), risk=5.0),
+)
+
+
+def age_mass(ages, rate):
+    """Relative head count between two ages in a stable population growing by rate (continuous, per year)."""
+    low, high = ages
+    if abs(rate) < 1e-9:
+        return high - low
+    return (math.exp(-rate * low) - math.exp(-rate * high)) / rate
+
+
+def stratum_shares(strata, growth_rate=1.0):
+    """Population share of each stratum, for a region growing by growth_rate a year.
+
+    Strata with a share of their own keep it. The others split the rest by their part of a stable
+    population, where the number of people of age a falls off as exp(-r a) with r = log(growth_rate):
+    fast-growing regions are young, shrinking ones old.
+    """
+    rate = math.log(growth_rate)
+    fixed = sum(stratum.share for stratum in strata if stratum.share is not None)
+    masses = [0.0 if stratum.share is not None else age_mass(stratum.ages, rate) for stratum in strata]
+    total = sum(masses)
+    shares = [stratum.share if stratum.share is not None else (1 - fixed) * mass / total
+              for stratum, mass in zip(strata, masses)]
+    return np.array(shares) / sum(shares)
+
+
+def settlement_map(rows, columns, towns=8, rural_share=0.3, rng=None):
+    """Relative density over a grid of cells: towns with Zipf-distributed sizes over an even rural background.
+
+    Town k (counting from 1) holds a part of the urban population proportional to 1/k, spread as a
+    Gaussian blob whose area grows with its size; rural_share of the population is spread evenly.
+    """
+    rng = np.random.default_rng(rng)
+    density = np.full((rows, columns), rural_share / (rows * columns))
+    if towns:
+        sizes = 1 / np.arange(1, towns + 1)
+        sizes /= sizes.sum()
+        centers = rng.random((towns, 2)) * (rows, columns)
+        spread = np.sqrt(sizes) * min(rows, columns) / 4
+        y, x = np.mgrid[:rows, :columns] + 0.5
+        distance = (y - centers[:, 0, None, None]) ** 2 + (x - centers[:, 1, None, None]) ** 2
+        blobs = np.exp(-distance / (2 * spread[:, None, None] ** 2))
+        blobs /= blobs.sum(axis=(1, 2), keepdims=True)
+        density += (1 - rural_share) * np.tensordot(sizes, blobs, 1)
+    return density
+
+
+class PopulationGenerator:
+    """Draws large heterogeneous populations for ArrayPopulation and TiledPopulation in a few vectorized passes.
+
+    The region's row of the world population dataset sets the population up: its density makes the
+    world more or less crowded than the default simulation (which stands for epidemic_sim.region), its
+    growth rate gives the age structure the strata are drawn from, and its head count sizes populations
+    built by scale. Every attribute is drawn for all agents at once, stratum by table lookup.
+
+    Agents are placed by drawing how many fall in each cell of a density map in proportion to its
+    density, then a uniform point within the cell; density_map is any 2D array with row 0 at the top of
+    the world, and a settlement_map() by default.
+    """
+
+    def __init__(self, selected_region=region, strata=None, config=None, density_map=None, seed=None):
+        self.region = selected_region
+        self.demographics = region_demographics(selected_region)
+        if self.demographics is None:
+            raise ValueError(f"No population data for {selected_region}")
+        self.strata = tuple(strata or (Stratum("all"),))
+        self.shares = stratum_shares(self.strata, self.demographics["growth_rate"])
+        self.config = config or SimulationConfig()
+        self.density_map = density_map
+        self.rng = np.random.default_rng(seed)
+
+    def crowding(self):
+        """Agent density relative to the default simulation: the region's density over epidemic_sim.region's.
+
+        The reference is the simulation's region (Israel), not data.region, since that is the region the
+        default agent count and screen size are configured for.
+        """
+        reference = region_demographics(defaults.region)
+        return self.demographics["density"] / reference["density"] if reference else 1.0
+
+    def world_size(self, num_agents):
+        return world_size(num_agents / self.crowding())
+
+    def head_count(self, scale):
+        """Agents standing for the region's population at scale agents per inhabitant."""
+        return max(1, round(self.demographics["population"] * scale))
+
+    def generate(self, num_agents, num_infected, width, height):
+        """Per-agent arrays of a new population, as ArrayPopulation's agents argument takes them.
+
+        Besides the arrays allocate() draws, they hold each agent's stratum (its index in strata) and age.
+        """
+        rng, n = self.rng, num_agents
+        stratum = rng.choice(len(self.strata), n, p=self.shares).astype(np.int8)
+
+        def per_stratum(values, dtype=np.float32):
+            return np.array(values, dtype=dtype)[stratum]
+
+        velocity = rng.uniform(-1, 1, (n, 2))
+        state = np.full(n, SUSCEPTIBLE, dtype=np.int8)
+        state[rng.choice(n, min(num_infected, n), replace=False)] = INFECTED
+        low, high = zip(*(s.recovery_duration for s in self.strata))
+        vaccination_rate = [self.config.vaccination_rate if s.vaccination_rate is None else s.vaccination_rate
+                            for s in self.strata]
+        return {
+            "position": self.place(n, width, height),
+            "velocity": velocity / np.maximum(np.hypot(velocity[:, 0], velocity[:, 1]), 1e-12)[:, None],
+            "speed": np.ones(n),
+            "state": state,
+            "infection_timer": np.zeros(n, dtype=np.float32),
+            "recovery_duration": per_stratum(low) + rng.random(n, dtype=np.float32) * per_stratum(np.subtract(high, low)),
+            "proximity_duration": np.zeros(n, dtype=np.float32),
+            "quarantine_time": rng.uniform(10, 30, n).astype(np.float32),
+            "in_quarantine": np.zeros(n, dtype=bool),
+            "time_in_quarantine": np.zeros(n, dtype=np.float32),
+            "will_vax": rng.random(n) < per_stratum(vaccination_rate, float),
+            "slowdown": np.zeros(n, dtype=bool),
+            "speedup": np.zeros(n, dtype=bool),
+            "risk": per_stratum([s.risk for s in self.strata]),
+            "stratum": stratum,
+            "age": self.draw_ages(stratum),
+        }
+
+    def draw_ages(self, stratum):
+        """Ages within each agent's stratum, by inverting the stable population's exp(-r a) age distribution."""
+        rate = math.log(self.demographics["growth_rate"])
+        low, high = (np.array(bounds, dtype=float)[stratum] for bounds in zip(*(s.ages for s in self.strata)))
+        uniform = self.rng.random(len(stratum))
+        if abs(rate) < 1e-9:
+            return (low + uniform * (high - low)).astype(np.float32)
+        return (low - np.log1p(uniform * np.expm1(-rate * (high - low))) / rate).astype(np.float32)
+
+    def place(self, n, width, height):
+        """(n, 2) positions drawn in proportion to the density map."""
+        density = self.density_map
+        if density is None:
+            density = settlement_map(DENSITY_ROWS, max(1, round(DENSITY_ROWS * width / height)), rng=self.rng)
+        density = np.asarray(density, dtype=float)
+        rows, columns = density.shape
+        cells = np.repeat(np.arange(density.size), self.rng.multinomial(n, density.ravel() / density.sum()))
+        x = (cells % columns + self.rng.random(n)) * (width / columns)
+        y = (cells // columns + self.rng.random(n)) * (height / rows)
+        return np.column_stack((x, y))
+
+    def population(self, num_agents, num_infected=None, width=None, height=None, tiled=False, **kwargs):
+        """ArrayPopulation, or TiledPopulation if tiled, of num_agents generated agents.
+
+        The world is sized by world_size() unless given, num_infected defaults to the default simulation's
+        infected fraction, and kwargs go to the population's constructor.
+        """
+        if num_infected is None:
+            num_infected = max(1, round(num_agents * defaults.no_infected / defaults.no_agents))
+        if width is None or height is None:
+            width, height = self.world_size(num_agents)
+        agents = self.generate(num_agents, num_infected, width, height)
+        engine = TiledPopulation if tiled else ArrayPopulation
+        return engine(width=width, height=height, config=self.config, agents=agents, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a heterogeneous population from demographic data.")
+    parser.add_argument("--region", default=region)
+    parser.add_argument("--agents", type=int, default=1_000_000)
+    parser.add_argument("--scale", type=float, default=None, help="agents per inhabitant, instead of --agents")
+    parser.add_argument("--strata", choices=("none", "age"), default="age")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generator = PopulationGenerator(args.region, AGE_STRATA if args.strata == "age" else None, seed=args.seed)
+    num_agents = generator.head_count(args.scale) if args.scale is not None else args.agents
+    start = time.perf_counter()
+    population = generator.population(num_agents, seed=args.seed)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(population)} agents for {args.region} in {elapsed:.2f}s, "
+          f"world {population.width:.0f}x{population.height:.0f}, {population.nbytes / 2**20:.0f} MB")
+    for index, stratum in enumerate(generator.strata):
+        members = population.stratum == index
+        print(f"  {stratum.name:>8}: {members.mean():6.1%}, mean age {population.age[members].mean():4.1f}, "
+              f"vaccinating {population.will_vax[members].mean():.0%}, risk {stratum.risk}")
+
+
+if __name__ == "__main__":
+    main()
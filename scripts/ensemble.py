@@ -0,0 +1,180 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from epidemic_sim import STAT_FIELDS, Simulation, SimulationConfig, no_agents, no_infected
+from meanfield import MeanFieldModel, hybrid_model
+from population import ArrayPopulation
+
+ENGINES = ("array", "agents", "meanfield", "hybrid")
+# Histogram bins per step and field kept by EnsembleSummary, in place of every replicate's curve
+HISTOGRAM_BINS = 256
+
+
+def build_replicate(parameters, seed, num_agents, num_infected, engine="array", dt=None):
+    """Headless simulation of one parameter set, seeded from a SeedSequence, stepping dt simulated seconds."""
+    config = SimulationConfig().copy(**(parameters or {}))
+    if engine == "agents":
+        return Simulation(num_agents, num_infected, config=config, seed=int(seed.generate_state(1)[0]), dt=dt)
+    if engine == "array":
+        return ArrayPopulation(num_agents, num_infected, seed=seed, config=config, dt=dt)
+    if engine == "meanfield":
+        return MeanFieldModel(num_agents, num_infected, config=config, dt=dt)
+    if engine == "hybrid":
+        return hybrid_model(num_agents, num_infected, seed=seed, config=config, dt=dt)
+    raise ValueError(f"Unknown engine: {engine}")
+
+
+def run_replicate(parameters, seed, steps, num_agents, num_infected, engine="array", dt=None):
+    """Run one seeded replicate headless and return its stats as a compact (steps, fields) array.
+
+    Each replicate owns its config, counters and RNG, so a pooled worker can run any number of them
+    back to back.
+    """
+    simulation = build_replicate(parameters, seed, num_agents, num_infected, engine, dt)
+    simulation.step(steps)
+    # The mean-field engine records expected counts, rounded here like the agent counts
+    return np.rint(simulation.stats).astype(np.int32)
+
+
+class EnsembleSummary:
+    """Replicate curves of one parameter set, reduced as they arrive.
+
+    Only the running total and a histogram of the values of every step and field over the replicates
+    are kept, so memory does not grow with the number of replicates. The bins of a field are one count
+    wide until one of its values reaches HISTOGRAM_BINS and double in width whenever needed after that,
+    so percentiles are exact for small counts and otherwise within one bin. Either way the summary of a
+    finished ensemble only depends on the seeds, not on the order the replicates arrive in. The running
+    mean is available while workers are still busy.
+    """
+
+    def __init__(self, parameters, replicates, steps):
+        self.parameters = dict(parameters or {})
+        self.replicates = replicates
+        self.completed = 0
+        self.total = np.zeros((steps, len(STAT_FIELDS)), dtype=np.int64)
+        self.histogram = np.zeros((steps, len(STAT_FIELDS), HISTOGRAM_BINS), dtype=np.int32)
+        self.bin_width = np.ones(len(STAT_FIELDS), dtype=np.int64)
+
+    def add(self, replicate, curve):
+        """Fold in the (steps, fields) curve of a replicate; the curve itself is not kept."""
+        curve = np.asarray(curve, dtype=np.int64)
+        top = curve.max(axis=0)
+        for field in np.flatnonzero(top >= self.bin_width * HISTOGRAM_BINS):
+            while top[field] >= self.bin_width[field] * HISTOGRAM_BINS:
+                # Merge pairs of bins; the edges stay on multiples of the width, so this is exact
+                merged = self.histogram[:, field].reshape(len(curve), HISTOGRAM_BINS // 2, 2).sum(axis=2)
+                self.histogram[:, field] = 0
+                self.histogram[:, field, :HISTOGRAM_BINS // 2] = merged
+                self.bin_width[field] *= 2
+
+        steps, fields = np.indices(curve.shape)
+        self.histogram[steps, fields, curve // self.bin_width] += 1
+        self.total += curve
+        self.completed += 1
+
+    def mean(self):
+        """Mean curve over the replicates completed so far."""
+        return self.total / max(self.completed, 1)
+
+    def percentiles(self, q=(5, 50, 95)):
+        """Percentile bands over completed replicates, shaped (len(q), steps, fields).
+
+        Interpolates between ranks like np.percentile; values within a bin wider than one count are
+        taken as spread evenly over it.
+        """
+        q = np.asarray(q, dtype=float)
+        if self.completed == 0:
+            return np.full(q.shape + self.total.shape, np.nan)
+        cumulative = np.cumsum(self.histogram, axis=2)
+
+        def ranked(rank):
+            """Value of the given 0-based rank at every step and field."""
+            bins = np.count_nonzero(cumulative <= rank, axis=2)
+            counts = np.take_along_axis(self.histogram, bins[..., None], axis=2)[..., 0]
+            before = np.take_along_axis(cumulative, bins[..., None], axis=2)[..., 0] - counts
+            return bins * self.bin_width + (self.bin_width - 1) * (rank - before + 0.5) / counts
+
+        rank = (self.completed - 1) * q / 100
+        low, high = np.floor(rank).astype(int), np.ceil(rank).astype(int)
+        bands = []
+        for position, lower, upper in zip(rank, low, high):
+            value = ranked(lower)
+            if upper != lower:
+                value = value + (position - lower) * (ranked(upper) - value)
+            bands.append(value)
+        return np.array(bands)
+
+    def save(self, path, q=(5, 50, 95)):
+        """Save the mean, the percentile bands of q and the histograms they are drawn from."""
+        np.savez_compressed(path, mean=self.mean(), percentiles=self.percentiles(q), q=np.array(q),
+                            histogram=self.histogram, bin_width=self.bin_width, completed=self.completed,
+                            fields=np.array(STAT_FIELDS), **{name: value for name, value in self.parameters.items()})
+
+
+def replicate_seeds(base_seed, replicates):
+    """Independent, reproducible seeds for each replicate of an ensemble."""
+    return np.random.SeedSequence(base_seed).spawn(replicates)
+
+
+def run_ensemble(parameters=None, replicates=100, steps=2000, base_seed=0, num_agents=no_agents,
+                 num_infected=no_infected, workers=None, on_result=None, engine="array", dt=None):
+    """Run seeded replicates of one parameter set across a process pool.
+
+    on_result(summary, replicate) is called in the parent each time a worker finishes, so callers can
+    watch the reduced curves converge instead of waiting for the whole ensemble.
+    """
+    summary = EnsembleSummary(parameters, replicates, steps)
+    seeds = replicate_seeds(base_seed, replicates)
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {
+            pool.submit(run_replicate, parameters, seed, steps, num_agents, num_infected, engine, dt): replicate
+            for replicate, seed in enumerate(seeds)
+        }
+        for future in as_completed(futures):
+            replicate = futures[future]
+            summary.add(replicate, future.result())
+            if on_result is not None:
+                on_result(summary, replicate)
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a Monte Carlo ensemble of headless simulations.")
+    parser.add_argument("--replicates", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--agents", type=int, default=no_agents)
+    parser.add_argument("--infected", type=int, default=no_infected)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", choices=ENGINES, default="array")
+    parser.add_argument("--dt", type=float, default=None, help="simulated seconds per step (default one frame)")
+    parser.add_argument("--infection-probability", type=float)
+    parser.add_argument("--recovery-probability", type=float)
+    parser.add_argument("--vaccination-succes-probability", type=float)
+    parser.add_argument("--vaccination-rate", type=float)
+    parser.add_argument("--output", default="ensemble.npz")
+    args = parser.parse_args()
+
+    parameters = {
+        name: getattr(args, name) for name in
+        ("infection_probability", "recovery_probability", "vaccination_succes_probability", "vaccination_rate")
+        if getattr(args, name) is not None
+    }
+
+    def progress(summary, replicate):
+        print(f"{summary.completed}/{args.replicates} replicates done "
+              f"(mean final infected: {summary.mean()[-1, STAT_FIELDS.index('infected')]:.1f})")
+
+    summary = run_ensemble(parameters, args.replicates, args.steps, args.seed, args.agents, args.infected,
+                           args.workers, on_result=progress, engine=args.engine, dt=args.dt)
+    summary.save(args.output)
+    print(f"Saved ensemble to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
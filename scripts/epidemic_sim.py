@@ -1,10 +1,24 @@
-import pygame
+import os
+from operator import attrgetter
 import random
-import matplotlib.pyplot as plot
+import numpy as np
+from checkpoint import (python_rng_state, read_snapshot, recorder_snapshot, restore_python_rng,
+                        restore_recorder, write_snapshot)
+from clock import COARSE_DT, SimulationClock
 from data import extract_probabilities
-
-# Initialize Pygame
-pygame.init()
+from events import (CONTACT_END, CONTACT_START, DEATH, INFECTION, QUARANTINE_ENTRY, RECOVERY, VACCINATED,
+                    VACCINATION_FAILED)
+from exposure import ExposureTracker
+from grouping import Group, cluster
+from lazy import lazy_import
+from profiling import PhaseProfiler
+from recorder import STAT_FIELDS, StatsRecorder
+from rendering import SpriteRenderer
+from scheduler import EventScheduler
+from spatial import RegionIndex, SpatialGrid
+
+# Only loaded once an agent or the window needs it, so array-only and headless workers start quickly
+pygame = lazy_import("pygame")
 
 # Screen dimensions
 SCREEN_WIDTH, SCREEN_HEIGHT = 1300, 800
@@ -16,13 +30,34 @@ RED = (255, 0, 0)        # Infected
 GREEN = (0, 255, 0)      # Recovered
 BLUE = (0, 0, 255)       # Susceptible
 GRAY = (169, 169, 169)   # Quarantine zones
+STATE_COLORS = {"S": BLUE, "I": RED, "R": GREEN}
 
 FPS = 144
-
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Epidemic Simulation")
-clock = pygame.time.Clock()
-FONT = pygame.font.SysFont(None, 24)
+# Longest real frame time fed to the simulation clock, so a stall (dragging the window, a breakpoint)
+# is dropped instead of being caught up on, and the most steps run between two frames
+MAX_FRAME_TIME = 0.25
+MAX_STEPS_PER_FRAME = 64
+
+# Display handles, created by init_display() only when a window is actually wanted
+screen = None
+clock = None
+FONT = None
+renderer = None
+
+def init_display():
+    """Initialize Pygame and open the simulation window."""
+    global screen
+    global clock
+    global FONT
+    global renderer
+
+    if screen is None:
+        pygame.init()
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("Epidemic Simulation")
+        clock = pygame.time.Clock()
+        FONT = pygame.font.SysFont(None, 24)
+        renderer = SpriteRenderer(screen, FONT, STATE_COLORS)
 
 # Simulation constants
 # region = 'France'
@@ -44,55 +79,113 @@ vaccination_succes_probability = 0.05
 
 vaccination_rate = 0.8
 
-infection_rate = 0
-recovery_rate = 0
-successful_vax_rate = 0
-failed_vax_rate = 0
-death_count = 0
+# Quarantine zones as (x, y, width, height, capacity); a capacity of None means the zone never fills up.
+# Worlds of another size shift the default layout to keep it anchored to their bottom right corner
+default_quarantine_zones = ((SCREEN_WIDTH - 600, SCREEN_HEIGHT - 400, 200, 100, None),)
+quarantine_avoidance_radius = 200
+quarantine_avoidance_strength = 5
+
+
+def default_zone_layout(width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """default_quarantine_zones moved to the bottom right corner of a world of width x height."""
+    return [(x + width - SCREEN_WIDTH, y + height - SCREEN_HEIGHT, zone_width, zone_height, capacity)
+            for x, y, zone_width, zone_height, capacity in default_quarantine_zones]
+
+# Where F5 saves and F9 restores the interactive simulation
+checkpoint_path = 'checkpoint.sim'
+
+# Per-agent fields stored as checkpoint columns, besides position, velocity and state. Durations and
+# timers are in simulated seconds. The optional ones hold None when unset, which is stored as -1.
+AGENT_FLOAT_FIELDS = ("speed", "recovery_duration", "quarantine_time", "infection_timer", "proximity_duration",
+                      "time_in_quarantine")
+AGENT_INT_FIELDS = ("uid",)
+AGENT_FLAG_FIELDS = ("in_quarantine", "will_vax", "slowdown", "speedup")
+AGENT_OPTIONAL_FIELDS = ("infected_since", "pending_check", "quarantined_since", "pending_release")
+
+class SimulationConfig:
+    """Tunable parameters of a single simulation; the module constants above are only its defaults."""
+
+    def __init__(self, region=region, slowdown=slowdown, speedup=speedup,
+                 repel_radius=repel_radius, infection_radius=infection_radius, grouping_radius=grouping_radius,
+                 infection_probability=infection_probability, recovery_probability=recovery_probability,
+                 vaccination_succes_probability=vaccination_succes_probability, vaccination_rate=vaccination_rate):
+        self.region = region
+        self.slowdown = slowdown
+        self.speedup = speedup
+        self.repel_radius = repel_radius
+        self.infection_radius = infection_radius
+        self.grouping_radius = grouping_radius
+        self.infection_probability = infection_probability
+        self.recovery_probability = recovery_probability
+        self.vaccination_succes_probability = vaccination_succes_probability
+        self.vaccination_rate = vaccination_rate
+
+    def copy(self, **changes):
+        """Return a new config with some parameters replaced."""
+        values = dict(vars(self))
+        for name, value in changes.items():
+            if name not in values:
+                raise ValueError(f"Unknown parameter: {name}")
+            values[name] = value
+        return SimulationConfig(**values)
+
+class Counters:
+    """Cumulative event counts of a single simulation."""
+
+    def __init__(self):
+        self.infection_rate = 0
+        self.recovery_rate = 0
+        self.successful_vax_rate = 0
+        self.failed_vax_rate = 0
+        self.death_count = 0
 
 class Agent:
-    def __init__(self, position=None, velocity=None, state="S"):
-        self.position = position or pygame.math.Vector2(random.uniform(0, SCREEN_WIDTH), random.uniform(0, SCREEN_HEIGHT))
-        self.velocity = velocity or pygame.math.Vector2(random.uniform(-1, 1), random.uniform(-1, 1)).normalize()
+    def __init__(self, position=None, velocity=None, state="S", config=None, rng=random, uid=None,
+                 world=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+        config = config or SimulationConfig()
+        self.position = position or pygame.math.Vector2(rng.uniform(0, world[0]), rng.uniform(0, world[1]))
+        self.velocity = velocity or pygame.math.Vector2(rng.uniform(-1, 1), rng.uniform(-1, 1)).normalize()
         self.speed = 1
         self.state = state
         self.color = BLUE if state == "S" else (RED if state == "I" else GREEN)
+        # Durations and timers are in simulated seconds
         self.infection_timer = 0
-        self.recovery_duration = FPS * (random.uniform(5,10))
+        self.recovery_duration = rng.uniform(5,10)
         self.proximity_duration = 0  # Time spent near an infected agent
-        self.quarantine_time = FPS * (random.uniform(10,30))
+        self.quarantine_time = rng.uniform(10,30)
         self.in_quarantine = False
         self.time_in_quarantine = 0
-        self.will_vax = True if random.random() < vaccination_rate else False
+        self.will_vax = True if rng.random() < config.vaccination_rate else False
         self.slowdown = False
         self.speedup = False
+        # Bookkeeping for the timers run by the simulation's event schedulers
+        self.infected_since = None
+        self.pending_check = None
+        self.quarantined_since = None
+        self.pending_release = None
+        self.zone = None  # The QuarantineZone holding the agent, if any
+        self.uid = uid  # Id of the agent in the event log, unique within its simulation
 
     def update_state(self):
         self.color = BLUE if self.state == "S" else (RED if self.state == "I" else GREEN)
 
-    def update_position(self):
+    def update_position(self, frames=1, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        """Move the agent by one step covering frames reference frames, in a world of width x height."""
         if not self.in_quarantine: 
-            self.position += self.velocity * self.speed
-            self._bounce_off_walls()
+            self.position += self.velocity * (self.speed * frames)
+            self._bounce_off_walls(width, height)
 
-    def _bounce_off_walls(self):
-        """Bounce the agent off the screen edges."""
-        if self.position.x < 0 or self.position.x > SCREEN_WIDTH:
+    def _bounce_off_walls(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        """Bounce the agent off the edges of the world."""
+        if self.position.x < 0 or self.position.x > width:
             self.velocity.x *= -1
-        if self.position.y < 0 or self.position.y > SCREEN_HEIGHT:
+        if self.position.y < 0 or self.position.y > height:
             self.velocity.y *= -1
 
         # Keep position within bounds
-        self.position.x = max(0, min(self.position.x, SCREEN_WIDTH))
-        self.position.y = max(0, min(self.position.y, SCREEN_HEIGHT))
+        self.position.x = max(0, min(self.position.x, width))
+        self.position.y = max(0, min(self.position.y, height))
 
-    def draw(self):
-        if self.state == "I":
-            pygame.draw.circle(screen, RED, (int(self.position.x), int(self.position.y)), infection_radius, width=1)
-        if self.state == "S":
-            pygame.draw.circle(screen, BLUE, (int(self.position.x), int(self.position.y)), repel_radius-5, width=1)
-        pygame.draw.circle(screen, self.color, (int(self.position.x), int(self.position.y)), 3)
-    
     def move_in_quarantine(self, rectangle):
         if self.in_quarantine:
             quarantine_zone = rectangle  # Example zone bounds
@@ -110,8 +203,8 @@ class Agent:
             self.update_state()
             self.position = pygame.math.Vector2(self.position.x, rectangle.top)
 
-    def repel_from_others(self, agents, min_distance=repel_radius):
-        """Steer the agent away from others if they are too close."""
+    def repel_from_others(self, agents, min_distance=repel_radius, frames=1):
+        """Steer the agent away from others if they are too close, by as much as frames frames of nudges."""
         for other_agent in agents:
             if other_agent is not self:  # Don't compare the agent to itself
                 distance = self.position.distance_to(other_agent.position)
@@ -120,84 +213,113 @@ class Agent:
                     repulsion_direction = self.position - other_agent.position
                     if repulsion_direction.length() > 0:
                         repulsion_direction = repulsion_direction.normalize()
-                    self.velocity += repulsion_direction * 0.1  # Adjust repulsion strength
+                    self.velocity += repulsion_direction * 0.1 * frames  # Adjust repulsion strength
                     self.velocity = self.velocity.normalize()
 
 
 class QuarantineZone:
-    def __init__(self, x, y, width, height, avoidance_radius, avoidance_strength):
+    def __init__(self, x, y, width, height, avoidance_radius, avoidance_strength, capacity=None):
         self.rect = pygame.Rect(x, y, width, height)
+        self.center = pygame.math.Vector2(self.rect.centerx, self.rect.centery)
         self.color = GRAY
         self.avoidance_radius = avoidance_radius
         self.avoidance_strength = avoidance_strength
-        self.agents_in_quarantine = []
+        self.capacity = capacity
+        # Agents held here; a dict keeps them in arrival order and drops them in O(1)
+        self.agents_in_quarantine = {}
         self.quarantine_delay = 0
 
+    def has_room(self):
+        return self.capacity is None or len(self.agents_in_quarantine) < self.capacity
+
+    def admit(self, agent):
+        self.agents_in_quarantine[agent] = None
+        agent.in_quarantine = True
+        agent.zone = self
+
+    def release(self, agent):
+        del self.agents_in_quarantine[agent]
+        agent.in_quarantine = False
+        agent.zone = None
+
     def draw(self):
-        """Draw the quarantine zone."""
-        pygame.draw.rect(screen, self.color, self.rect, 2)
-        s = pygame.Surface((self.rect.width, self.rect.height))
-        s.set_alpha(30)
-        s.fill(self.color)
-        screen.blit(s, (self.rect.x, self.rect.y))
-
-    def steer_agents(self, agents):
+        """Draw the quarantine zone, with its occupancy if it has a capacity."""
+        renderer.draw_zone(self.rect, self.color)
+        if self.capacity is not None:
+            renderer.draw_text(f'{len(self.agents_in_quarantine)}/{self.capacity}', BLACK, (self.rect.x + 4, self.rect.y + 4))
+
+    def steer_agents(self, agents, frames=1):
         """Steer non-infected agents away from the quarantine zone."""
         for agent in agents:
-            if agent.state != "I" or agent.will_vax is False:  # Only affect susceptible or recovered agents or anti-vaxxers
-                distance = agent.position.distance_to(pygame.math.Vector2(self.rect.centerx, self.rect.centery))
-                if distance <= self.avoidance_radius:  # Agent is within avoidance range
-                    self.steer_away(agent)
-
-    def steer_away(self, agent):
-        """Steer the agent away from the quarantine zone."""
-        zone_center = pygame.math.Vector2(self.rect.centerx, self.rect.centery)
-        avoidance_direction = agent.position - zone_center
+            if self.repels(agent):
+                self.steer_away(agent, frames)
+
+    def repels(self, agent):
+        """Whether the zone pushes this agent away: a susceptible, recovered or anti-vaxxer within avoidance range."""
+        if agent.state != "I" or agent.will_vax is False:
+            return agent.position.distance_to(self.center) <= self.avoidance_radius
+        return False
+
+    def steer_away(self, agent, frames=1):
+        """Steer the agent away from the quarantine zone, as much as frames frames of steering would."""
+        avoidance_direction = agent.position - self.center
         avoidance_direction = avoidance_direction.normalize()  # Normalize to avoid making it too fast
-        agent.velocity += avoidance_direction * self.avoidance_strength  # Modify the velocity to steer away
+        agent.velocity += avoidance_direction * self.avoidance_strength * frames  # Modify the velocity to steer away
 
         # Normalize the velocity to avoid making the agent go too fast
         if agent.velocity.length() > 1:
             agent.velocity = agent.velocity.normalize()
 
-    def redirect_group_to_quarantine(self, group):
-        """Redirect a group of infected agents towards the quarantine zone."""
-        zone_center = pygame.math.Vector2(self.rect.centerx, self.rect.centery)
+    def redirect_group_to_quarantine(self, group, entry_radius=infection_radius, frames=1):
+        """Redirect a group of infected agents towards the quarantine zone, steering them as much as frames
+        frames of steering would, and return those who entered it."""
+        zone_center = self.center
+        entered = []
 
         for agent in group:
             steering_direction = zone_center - agent.position
             steering_direction = steering_direction.normalize()
-            agent.velocity += steering_direction * 0.1  # Modify the velocity to move towards the quarantine center
+            agent.velocity += steering_direction * 0.1 * frames  # Modify the velocity to move towards the quarantine center
 
             # Normalize the velocity to avoid fast movement
             if agent.velocity.length() > 1:
                 agent.velocity = agent.velocity.normalize()
 
-            # Check if the agent has reached the quarantine zone
-            if agent.position.distance_to(zone_center) < infection_radius:
-                self.agents_in_quarantine.append(agent)
-                agent.in_quarantine = True
-
-def infect_random_agent(agents):
-    global infection_rate
-    index = random.randint(0,len(agents) - 1) 
-    agents[index].state = "I"
-    agents[index].update_state()
-    infection_rate += 1
-
-def add_sus_agent(agents):
-    agents.append(Agent())
-
-def plot_population_stats(stats):
-    time_steps = [i for i in range(len(stats))]
-    susceptible = [stat[0] for stat in stats]
-    infected = [stat[1] for stat in stats]
-    recovered = [stat[2] for stat in stats]
-    death_count = [stat[3] for stat in stats]
-    vax_succes_rate = [stat[4] for stat in stats]
-    vax_fail_rate = [stat[5] for stat in stats]
-    infection_rate = [stat[6] for stat in stats]
-    recovery_rate = [stat[7] for stat in stats]
+            # Check if the agent has reached the quarantine zone, and whether there is still room for it
+            if agent.position.distance_to(zone_center) < entry_radius and not agent.in_quarantine and self.has_room():
+                self.admit(agent)
+                entered.append(agent)
+
+        return entered
+
+def infect_random_agent(simulation):
+    agent = simulation.agents[simulation.rng.randint(0,len(simulation.agents) - 1)]
+    if agent.state != "I":
+        simulation.log_event(INFECTION, agent)
+    simulation.set_state(agent, "I")
+    simulation.counters.infection_rate += 1
+
+def add_sus_agent(simulation):
+    simulation.agents.append(Agent(config=simulation.config, rng=simulation.rng, uid=simulation.next_uid,
+                                   world=(simulation.width, simulation.height)))
+    simulation.next_uid += 1
+    simulation.recorder.transition(None, "S")
+
+def plot_population_stats(stats, time_steps=None):
+    import matplotlib.pyplot as plot
+
+    # Columns are read as views, so recorded (or memory-mapped) arrays are plotted without copying
+    stats = np.asarray(stats).reshape(-1, len(STAT_FIELDS))
+    if time_steps is None:
+        time_steps = np.arange(len(stats))
+    susceptible = stats[:, 0]
+    infected = stats[:, 1]
+    recovered = stats[:, 2]
+    death_count = stats[:, 3]
+    vax_succes_rate = stats[:, 4]
+    vax_fail_rate = stats[:, 5]
+    infection_rate = stats[:, 6]
+    recovery_rate = stats[:, 7]
 
     plot.figure(figsize=(10, 6))
     
@@ -231,233 +353,666 @@ def plot_population_stats(stats):
     plot.show()
 
 
-def track_history(agents, stats):
-    global death_count
-    global failed_vax_rate
-    global successful_vax_rate
-    global infection_rate
-    global recovery_rate
-
-    susceptible = sum(1 for a in agents if a.state == "S")
-    infected = sum(1 for a in agents if a.state == "I")
-    recovered = sum(1 for a in agents if a.state == "R")
-
-    stats.append((susceptible, infected, recovered, death_count, failed_vax_rate, successful_vax_rate, infection_rate, recovery_rate ))
-
-def document_probabilities():
-    global infection_probability
-    global recovery_probability
-    global vaccination_rate
+def document_probabilities(config):
+    infection, recovery, vaccination = extract_probabilities(selected_region=config.region)
 
-    infection_probability, recovery_probability, vaccination_rate = extract_probabilities(selected_region=region)
+    # Keep the defaults for any rate the datasets cannot provide for this region
+    if infection is not None:
+        config.infection_probability = infection
+    if recovery is not None:
+        config.recovery_probability = recovery
+    if vaccination is not None:
+        config.vaccination_rate = vaccination
 
 class Simulation:
      
-    def __init__(self, num_agents = no_agents, num_infected = no_infected, withDataset = False):
+    def __init__(self, num_agents = no_agents, num_infected = no_infected, withDataset = False, spatial_index = True,
+                 config = None, seed = None, sample_every = 1, stats_path = None, profiler = None, render_every = 1,
+                 quarantine_zones = None, dt = None, events = None, width = SCREEN_WIDTH, height = SCREEN_HEIGHT,
+                 first_uid = 0, tick_offset = 0):
         
-        global infection_rate
-        infection_rate += num_infected
+        self.config = config or SimulationConfig()
+        # The world agents move in; the window shows the default, screen-sized one
+        self.width, self.height = width, height
+        self.counters = Counters()
+        self.rng = random.Random(seed)
+        # Every tick advances the model by dt simulated seconds, one display frame by default
+        self.clock = SimulationClock(1 / FPS, dt)
 
-        self.agents = [Agent() for _ in range(num_agents)]
+        self.withDataset = withDataset
+        if( withDataset is True ):
+            document_probabilities(self.config)
+
+        self.counters.infection_rate += num_infected
+
+        self.agents = [Agent(config=self.config, rng=self.rng, uid=first_uid + i, world=(width, height))
+                       for i in range(num_agents)]
+        self.next_uid = first_uid + num_agents
+        # EventLog receiving infections, deaths, recoveries and quarantine moves, if any. A log shared
+        # with earlier runs numbers this run's ticks after theirs, and first_uid keeps its agent ids apart
+        self.events = events
+        self.tick_offset = tick_offset
+
+        # Ticks completed so far; recovery checks and quarantine releases are scheduled against it
+        self.tick = 0
+        self.recovery_checks = EventScheduler()
+        self.releases = EventScheduler()
+        self.exposure = ExposureTracker()
+        self.recorder = StatsRecorder(sample_every, spill_path=stats_path)
+        self.recorder.count(self.agents)
 
         for _ in range(num_infected):
-            self.agents[random.randint(0, len(self.agents) - 1)].state = "I"
-
-        self.quarantine = QuarantineZone(
-            SCREEN_WIDTH - 600,
-            SCREEN_HEIGHT - 400,
-            200,
-            100,
-            200,
-            5
-        )
-
-        self.stats = []
-        self.running = True
+            agent = self.agents[self.rng.randint(0, len(self.agents) - 1)]
+            if agent.state != "I":
+                self.log_event(INFECTION, agent)
+            self.set_state(agent, "I")
+
+        if quarantine_zones is None:
+            quarantine_zones = default_zone_layout(width, height)
+        self.quarantine_zones = [
+            QuarantineZone(x, y, width, height, quarantine_avoidance_radius, quarantine_avoidance_strength, capacity)
+            for x, y, width, height, capacity in quarantine_zones
+        ]
+        self.zone_index = self.build_zone_index()
+        # Groups of infected pro-vax agents found by the last handle_grouping pass
+        self.groups = []
 
-        self.withDataset = withDataset
-        if( withDataset is True ):
-            document_probabilities()
+        self.running = True
+        self.spatial_index = spatial_index
+        self.profiler = profiler
+        # Draw every render_every-th frame only; the model keeps advancing in simulated time
+        self.render_every = render_every
+        # Simulated seconds played per real second in the window
+        self.time_scale = 1.0
     
     def run(self):
-        
+        """Interactive front-end: advance the model in fixed steps at time_scale times real time and draw it.
+
+        Real time is accumulated every frame and spent in whole steps of dt, so simulated time runs at the
+        same pace whatever frame rate the display manages; what is left over places the drawn agents
+        between their last two positions.
+        """
+        global screen
+        global renderer
+
+        init_display()
+        lag = 0.0
+        frame = 0
+        previous = {}
         while self.running:
-            clock.tick(FPS)
-            self.handle_events()
-            self.update_agents()
-            self.handle_quarantine()
-            self.handle_infections()
-            self.handle_grouping()
-            self.handle_death()
-            self.slow_down_infected_agents()
-            self.speed_up_recovered_agents()
-            self.render()
+            lag += min(clock.tick(FPS) / 1000, MAX_FRAME_TIME) * self.time_scale
+            self.run_phase("handle_events", self.handle_events)
+
+            dt = self.clock.dt
+            steps = int(lag // dt)
+            if steps > MAX_STEPS_PER_FRAME:
+                # Too slow to keep up at this speed; simulated time falls behind rather than piling up
+                steps, lag = MAX_STEPS_PER_FRAME, MAX_STEPS_PER_FRAME * dt
+            for step in range(steps):
+                if step == steps - 1:
+                    previous = {agent: pygame.math.Vector2(agent.position) for agent in self.agents}
+                self.advance()
+                self.end_tick()
+            lag -= steps * dt
+
+            frame += 1
+            if frame % self.render_every == 0:
+                self.run_phase("render", lambda: self.render(previous, min(1.0, lag / dt)))
         
-        plot_population_stats(self.stats)
+        if self.profiler is not None:
+            self.profiler.close()
+        plot_population_stats(self.stats, self.recorder.ticks)
         pygame.quit()
+        screen = None
+        renderer = None
+
+    # Phases of one tick, in the order step() runs them
+    PHASES = ("update_agents", "handle_quarantine", "handle_infections", "handle_grouping", "handle_death", "track_history")
+
+    def step(self, n = 1):
+        """Advance the model by n ticks of dt seconds each, without touching the display."""
+        for _ in range(n):
+            self.advance()
+            self.end_tick()
+
+    def set_dt(self, dt):
+        """Switch to ticks of dt simulated seconds, e.g. COARSE_DT to fast-forward, keeping every running timer.
+
+        The time already spent infected or in quarantine is banked and the pending recovery checks and
+        releases are scheduled again in ticks of the new length.
+        """
+        clock = self.clock
+        if dt == clock.dt:
+            return
+        for agent in self.agents:
+            if agent.state == "I":
+                agent.infection_timer += (self.tick - agent.infected_since) * clock.dt
+                agent.infected_since = self.tick
+            if agent.in_quarantine and agent.quarantined_since < self.tick:
+                agent.time_in_quarantine += (self.tick - agent.quarantined_since) * clock.dt
+                agent.quarantined_since = self.tick
+
+        clock.dt = dt
+        self.recovery_checks = EventScheduler()
+        self.releases = EventScheduler()
+        for agent in self.agents:
+            if agent.state == "I":
+                self.schedule_recovery_check(agent)
+            if agent.in_quarantine:
+                self.schedule_release(agent)
+
+    def fast_forward(self, seconds, dt = COARSE_DT):
+        """Advance the model by seconds of simulated time in coarse ticks of dt, then go back to the current dt."""
+        fine = self.clock.dt
+        self.set_dt(dt)
+        self.step(self.clock.steps(seconds))
+        self.set_dt(fine)
+
+    def advance(self):
+        """Run the phases of one tick, timing each one if a profiler is attached."""
+        if self.profiler is None:
+            for phase in self.PHASES:
+                getattr(self, phase)()
+        else:
+            for phase in self.PHASES:
+                self.profiler.call(phase, getattr(self, phase))
+
+    def run_phase(self, name, method):
+        if self.profiler is None:
+            method()
+        else:
+            self.profiler.call(name, method)
+
+    def end_tick(self):
+        self.tick += 1
+        self.clock.advance()
+        if self.profiler is not None:
+            self.profiler.end_tick()
+
+    def run_steps(self, n):
+        """Headless batch run: advance n ticks as fast as possible and return the recorded stats."""
+        self.step(n)
+        return self.stats
+
+    @property
+    def stats(self):
+        """Recorded stats history, one row per sampled tick in STAT_FIELDS order."""
+        return self.recorder.stats
+
+    def track_history(self):
+        self.recorder.record(self.counters)
+
+    def save_checkpoint(self, path):
+        """Write the complete model state to path: agents, quarantine, timers, counters, config, RNG and stats."""
+        agents = self.agents
+
+        def column(name, dtype):
+            return np.fromiter(map(attrgetter(name), agents), dtype, len(agents))
+
+        # Scheduled events and the quarantine refer to agents by their position in self.agents, looked up
+        # by object id in one sorted search rather than through a dict over the whole population
+        ids = np.fromiter(map(id, agents), np.int64, len(agents))
+        order = np.argsort(ids)
+
+        def locate(referenced):
+            """Positions of the referenced agents, and whether each of them is still in the simulation."""
+            wanted = np.fromiter(map(id, referenced), np.int64, len(referenced))
+            if len(agents) == 0:
+                return np.zeros(len(wanted), dtype=np.intp), np.zeros(len(wanted), dtype=bool)
+            slots = order[np.minimum(np.searchsorted(ids, wanted, sorter=order), len(agents) - 1)]
+            return slots, ids[slots] == wanted
+
+        def positions(referenced):
+            slots, found = locate(referenced)
+            if not found.all():
+                raise ValueError("Checkpoint refers to agents that are no longer in the simulation")
+            return slots
+
+        def live_events(scheduler, is_live):
+            entries = [(tick, event, agent) for tick, event, agent in scheduler.queue if is_live(event, agent)]
+            table = np.zeros((len(entries), 3), dtype=np.int64)
+            if entries:
+                table[:, 0], table[:, 1], _ = zip(*entries)
+                table[:, 2] = positions([agent for _, _, agent in entries])
+            return table
+
+        arrays = {
+            "position": np.column_stack((column("position.x", np.float64), column("position.y", np.float64))),
+            "velocity": np.column_stack((column("velocity.x", np.float64), column("velocity.y", np.float64))),
+            "state": np.fromiter(map("SIR".index, map(attrgetter("state"), agents)), np.int8, len(agents)),
+        }
+        for name in AGENT_FLOAT_FIELDS:
+            arrays[name] = column(name, np.float64)
+        for name in AGENT_INT_FIELDS:
+            arrays[name] = column(name, np.int64)
+        for name in AGENT_FLAG_FIELDS:
+            arrays[name] = column(name, bool)
+        for name in AGENT_OPTIONAL_FIELDS:
+            # None converts to NaN here; the values themselves are tick numbers and event ids, exact as floats
+            values = np.array(list(map(attrgetter(name), agents)), dtype=np.float64)
+            arrays[name] = np.where(np.isnan(values), -1, values).astype(np.int64)
+
+        # Only events that will still fire are kept; stale ones would be skipped when popped anyway
+        arrays["recovery_checks"] = live_events(
+            self.recovery_checks, lambda event, agent: agent.state == "I" and agent.pending_check == event)
+        arrays["releases"] = live_events(
+            self.releases, lambda event, agent: agent.in_quarantine and agent.pending_release == event)
+        # Members of every zone back to back, in arrival order; meta holds how many belong to each zone
+        members = [agent for zone in self.quarantine_zones for agent in zone.agents_in_quarantine]
+        arrays["quarantine_members"] = positions(members)
+        # Contacts with an agent that died this tick would only be dropped at the next update, so they go now
+        pairs = self.exposure.pairs
+        infectors, infector_found = locate([infector for infector, _ in pairs])
+        susceptibles, susceptible_found = locate([susceptible for _, susceptible in pairs])
+        kept = infector_found & susceptible_found
+        arrays["contact_pairs"] = np.column_stack(
+            (infectors, susceptibles, np.fromiter(pairs.values(), np.int64, len(pairs))))[kept]
+        exposed, found = locate(list(self.exposure.contacts))
+        arrays["exposed"] = exposed[found]
+
+        rng_meta, arrays["rng_words"] = python_rng_state(self.rng)
+        recorder_meta, arrays["stats"] = recorder_snapshot(self.recorder)
+        meta = {
+            "tick": self.tick,
+            "clock": self.clock.snapshot(),
+            "config": vars(self.config),
+            "counters": vars(self.counters),
+            "rng": rng_meta,
+            "recorder": recorder_meta,
+            "next_event_ids": [self.recovery_checks.next_id, self.releases.next_id],
+            "next_uid": self.next_uid,
+            "tick_offset": self.tick_offset,
+            "quarantine_zones": [
+                {"rect": list(zone.rect), "capacity": zone.capacity, "avoidance_radius": zone.avoidance_radius,
+                 "avoidance_strength": zone.avoidance_strength, "quarantine_delay": zone.quarantine_delay,
+                 "members": len(zone.agents_in_quarantine)}
+                for zone in self.quarantine_zones
+            ],
+            "withDataset": self.withDataset,
+            "spatial_index": self.spatial_index,
+            "world": [self.width, self.height],
+        }
+        write_snapshot(path, meta, arrays)
+
+    def load_checkpoint(self, path, mmap = True, stats_path = None):
+        """Replace the model state with a checkpoint written by save_checkpoint(); running on from it
+        reproduces the original run exactly. The profiler, render settings and event log are left as they are."""
+        meta, arrays = read_snapshot(path, mmap)
+
+        self.config = SimulationConfig(**meta["config"])
+        self.counters = Counters()
+        vars(self.counters).update(meta["counters"])
+        self.rng = random.Random()
+        restore_python_rng(self.rng, meta["rng"], arrays["rng_words"])
+        self.tick = meta["tick"]
+        self.next_uid = meta["next_uid"]
+        self.tick_offset = meta["tick_offset"]
+        self.clock = SimulationClock(**meta["clock"])
+        self.withDataset = meta["withDataset"]
+        self.spatial_index = meta["spatial_index"]
+        self.width, self.height = meta["world"]
+
+        # Agents are rebuilt column by column and their attributes filled in one dict update each, which
+        # is far quicker than Agent.__init__ plus a setattr per field
+        states = ["SIR"[code] for code in arrays["state"].tolist()]
+        columns = {
+            "position": list(map(pygame.math.Vector2, arrays["position"][:, 0].tolist(), arrays["position"][:, 1].tolist())),
+            "velocity": list(map(pygame.math.Vector2, arrays["velocity"][:, 0].tolist(), arrays["velocity"][:, 1].tolist())),
+            "state": states,
+            "color": [STATE_COLORS[state] for state in states],
+        }
+        for name in AGENT_FLOAT_FIELDS + AGENT_INT_FIELDS + AGENT_FLAG_FIELDS:
+            columns[name] = arrays[name].tolist()
+        for name in AGENT_OPTIONAL_FIELDS:
+            columns[name] = [None if value == -1 else value for value in arrays[name].tolist()]
+        columns["zone"] = [None] * len(states)
+
+        # Same attribute order as Agent.__init__, so the instances keep sharing their dict keys
+        names = ("position", "velocity", "speed", "state", "color", "infection_timer", "recovery_duration",
+                 "proximity_duration", "quarantine_time", "in_quarantine", "time_in_quarantine", "will_vax",
+                 "slowdown", "speedup") + AGENT_OPTIONAL_FIELDS + ("zone", "uid")
+        self.agents = []
+        for values in zip(*(columns[name] for name in names)):
+            agent = Agent.__new__(Agent)
+            agent.__dict__.update(zip(names, values))
+            self.agents.append(agent)
+
+        agents = self.agents
+        self.recovery_checks = EventScheduler()
+        self.recovery_checks.restore([(tick, event, agents[i]) for tick, event, i in arrays["recovery_checks"].tolist()],
+                                     meta["next_event_ids"][0])
+        self.releases = EventScheduler()
+        self.releases.restore([(tick, event, agents[i]) for tick, event, i in arrays["releases"].tolist()],
+                              meta["next_event_ids"][1])
+
+        self.quarantine_zones = []
+        members = iter(arrays["quarantine_members"].tolist())
+        for layout in meta["quarantine_zones"]:
+            zone = QuarantineZone(*layout["rect"], layout["avoidance_radius"], layout["avoidance_strength"],
+                                  layout["capacity"])
+            zone.quarantine_delay = layout["quarantine_delay"]
+            for _ in range(layout["members"]):
+                zone.admit(agents[next(members)])
+            self.quarantine_zones.append(zone)
+        self.zone_index = self.build_zone_index()
+        self.groups = []
+        self.exposure = ExposureTracker()
+        self.exposure.restore((((agents[i], agents[j]), start) for i, j, start in arrays["contact_pairs"].tolist()),
+                              [agents[i] for i in arrays["exposed"].tolist()])
+
+        self.recorder = restore_recorder(meta["recorder"], arrays["stats"], stats_path)
+        self.running = True
+
+    @classmethod
+    def from_checkpoint(cls, path, mmap = True, stats_path = None, profiler = None, render_every = 1, events = None):
+        """New simulation resumed from a checkpoint, e.g. to fork a run and try an intervention on it."""
+        simulation = cls.__new__(cls)
+        simulation.profiler = profiler
+        simulation.events = events
+        simulation.render_every = render_every
+        simulation.time_scale = 1.0
+        simulation.load_checkpoint(path, mmap, stats_path)
+        return simulation
+
+    def set_state(self, agent, state):
+        """Move an agent to a new state, keeping head counts, speed and scheduled timers in sync."""
+        if agent.state == state:
+            return
+
+        if agent.state == "I":
+            # Bank the time this infection ran; infection_timer carries over into the next infection
+            agent.infection_timer += (self.tick - agent.infected_since) * self.clock.dt
+            agent.infected_since = None
+
+        self.recorder.transition(agent.state, state)
+        agent.state = state
+        agent.update_state()
+
+        if state == "I":
+            agent.infected_since = self.tick
+            self.schedule_recovery_check(agent)
+            if agent.slowdown is False:
+                agent.speed *= self.config.slowdown
+                agent.slowdown = True
+        elif state == "R" and agent.speedup is False:
+            agent.speed *= self.config.speedup
+            agent.speedup = True
+
+    def log_event(self, kind, agent, source = None):
+        """Log an event of agent (infected by source, if given) at its current position when an event log is attached."""
+        if self.events is not None:
+            self.events.log(self.tick_offset + self.tick, kind, agent.uid, -1 if source is None else source.uid, agent.position)
+
+    def enter_quarantine(self, agent):
+        """Schedule the release of an agent that just reached the quarantine zone."""
+        self.log_event(QUARANTINE_ENTRY, agent)
+        # Time in quarantine starts counting at the next handle_quarantine pass
+        agent.quarantined_since = self.tick + 1
+        self.schedule_release(agent)
+
+    def schedule_recovery_check(self, agent):
+        """Schedule the check that resolves an infection once its remaining duration has run."""
+        # handle_death counts its own tick too, so the check is due after the remaining ticks minus one
+        remaining = max(1, self.clock.steps(agent.recovery_duration - agent.infection_timer))
+        agent.pending_check = self.recovery_checks.schedule(agent.infected_since + remaining - 1, agent)
+
+    def schedule_release(self, agent):
+        remaining = max(0, self.clock.steps(agent.quarantine_time - agent.time_in_quarantine))
+        agent.pending_release = self.releases.schedule(agent.quarantined_since + remaining, agent)
 
     def handle_events(self):
-   
-        global infection_probability
-        global recovery_probability
-        global vaccination_succes_probability
+        config = self.config
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_q:
-                    infect_random_agent(self.agents)
+                    infect_random_agent(self)
                 elif event.key == pygame.K_z:
-                    add_sus_agent(self.agents)
+                    add_sus_agent(self)
                 elif event.key == pygame.K_1:
-                   infection_probability = min(1.00, infection_probability + 0.05)
+                   config.infection_probability = min(1.00, config.infection_probability + 0.05)
                 elif event.key == pygame.K_2:
-                    infection_probability = max(0.00, infection_probability - 0.05)
+                    config.infection_probability = max(0.00, config.infection_probability - 0.05)
                 elif event.key == pygame.K_3:
-                   recovery_probability = min(1.00, recovery_probability + 0.05)
+                   config.recovery_probability = min(1.00, config.recovery_probability + 0.05)
                 elif event.key == pygame.K_4:
-                   recovery_probability = max(0.00, recovery_probability - 0.05)
+                   config.recovery_probability = max(0.00, config.recovery_probability - 0.05)
                 elif event.key == pygame.K_5:
-                   vaccination_succes_probability = min(1.00, vaccination_succes_probability + 0.05)
+                   config.vaccination_succes_probability = min(1.00, config.vaccination_succes_probability + 0.05)
                 elif event.key == pygame.K_6:
-                   vaccination_succes_probability = max(0.00, vaccination_succes_probability - 0.05)
+                   config.vaccination_succes_probability = max(0.00, config.vaccination_succes_probability - 0.05)
+                elif event.key == pygame.K_p:
+                    if self.profiler is None:
+                        self.profiler = PhaseProfiler()
+                    else:
+                        self.profiler.close()
+                        self.profiler = None
+                elif event.key == pygame.K_EQUALS:
+                    self.render_every += 1
+                elif event.key == pygame.K_MINUS:
+                    self.render_every = max(1, self.render_every - 1)
+                elif event.key == pygame.K_RIGHTBRACKET:
+                    self.time_scale *= 2
+                elif event.key == pygame.K_LEFTBRACKET:
+                    self.time_scale /= 2
+                elif event.key == pygame.K_f:
+                    # Coarse ticks to fast-forward, or back to one tick per display frame
+                    self.set_dt(self.clock.frame if self.clock.dt != self.clock.frame else COARSE_DT)
+                elif event.key == pygame.K_F5:
+                    self.save_checkpoint(checkpoint_path)
+                elif event.key == pygame.K_F9 and os.path.exists(checkpoint_path):
+                    self.load_checkpoint(checkpoint_path)
                 elif event.key == pygame.K_r:
-                    plot_population_stats(self.stats)
-                    self.__init__()
+                    plot_population_stats(self.stats, self.recorder.ticks)
+                    self.restart()
+
+    def build_grid(self, radius):
+        """Index the agents on a grid keyed on radius, or None to fall back to full scans."""
+        if not self.spatial_index:
+            return None
+        return SpatialGrid(radius).build(self.agents)
+
+    def nearby(self, grid, position, radius):
+        """Candidate neighbours of position, in the same order as self.agents."""
+        if grid is None:
+            return self.agents
+        return grid.query(position, radius)
+
+    def restart(self):
+        """Start a new run with fresh agents. Parameters tuned with the keys carry over, counters start
+        from zero, and an attached event log goes on with new agent ids and ticks after the last run's."""
+        time_scale = self.time_scale
+        self.__init__(config=self.config, spatial_index=self.spatial_index, profiler=self.profiler,
+                      render_every=self.render_every, quarantine_zones=self.zone_layout(), dt=self.clock.dt,
+                      events=self.events, width=self.width, height=self.height, first_uid=self.next_uid,
+                      tick_offset=self.tick_offset + self.tick)
+        self.time_scale = time_scale
+
+    def zone_layout(self):
+        """The quarantine zones as (x, y, width, height, capacity), as passed to __init__."""
+        return [(*zone.rect, zone.capacity) for zone in self.quarantine_zones]
+
+    def build_zone_index(self):
+        """Lookup from grid cell to the zones whose avoidance radius reaches into it; zones never move."""
+        cell_size = max((zone.avoidance_radius for zone in self.quarantine_zones), default=1)
+        return RegionIndex([(zone, zone.center, zone.avoidance_radius) for zone in self.quarantine_zones], cell_size)
+
+    def nearest_open_zone(self, position):
+        """Closest quarantine zone that still has room, or None once every zone is full."""
+        open_zones = [zone for zone in self.quarantine_zones if zone.has_room()]
+        return min(open_zones, key=lambda zone: position.distance_squared_to(zone.center), default=None)
 
     def update_agents(self):
+        repel_radius = self.config.repel_radius
+        grid = self.build_grid(repel_radius)
+        # Agents move while this pass runs, so widen the query by the largest step any agent can take
+        frames = self.clock.frames
+        max_step = max((agent.speed * frames * agent.velocity.length() for agent in self.agents), default=0)
+
         for agent in self.agents:
-            agent.update_position()
-            agent.repel_from_others(self.agents)
+            agent.update_position(frames, self.width, self.height)
+            agent.repel_from_others(self.nearby(grid, agent.position, repel_radius + max_step), repel_radius, frames)
 
     def handle_grouping(self):
-        """Handle the grouping of infected agents and redirect them to the quarantine zone."""
-        for agent in self.agents:
-            if agent.state == "I" and agent.will_vax == True:
-                nearby_infected = [
-                    other_agent for other_agent in self.agents 
-                    if other_agent.state == "I"
-                    and other_agent.will_vax == True 
-                    and agent.position.distance_to(other_agent.position) < grouping_radius
-                ]
-                if len(nearby_infected) > 1:  # If there are nearby infected agents, form a group
-                    group_center = pygame.math.Vector2(0, 0)
-                    for nearby_agent in nearby_infected:
-                        group_center += nearby_agent.position
-                    group_center /= len(nearby_infected)  # Find the center of the group
-
-                    self.quarantine.redirect_group_to_quarantine(nearby_infected)
+        """Cluster infected pro-vax agents into groups and redirect each group once to the nearest zone with room.
+
+        Agents closer than grouping_radius are linked, and a group is a connected cluster of two or more
+        agents, so every agent belongs to at most one group per tick. The groups stay available in
+        self.groups until the next pass.
+        """
+        candidates = [agent for agent in self.agents if agent.state == "I" and agent.will_vax == True]
+        points = np.array([(agent.position.x, agent.position.y) for agent in candidates], dtype=float).reshape(-1, 2)
+        labels, sizes, centers = cluster(points, self.config.grouping_radius)
+
+        members = [[] for _ in sizes]
+        for agent, label in zip(candidates, labels.tolist()):
+            members[label].append(agent)
+        self.groups = [Group(group, pygame.math.Vector2(center))
+                       for group, center in zip(members, centers.tolist()) if len(group) > 1]
+
+        for group in self.groups:
+            zone = self.nearest_open_zone(group.center)
+            if zone is None:
+                continue  # Every zone is full; the group keeps roaming until one frees up
+            for entrant in zone.redirect_group_to_quarantine(group.members, self.config.infection_radius,
+                                                             self.clock.frames):
+                self.enter_quarantine(entrant)
     
     def handle_infections(self):
-        global infection_rate
+        """Roll one infection per susceptible in range of any infected agent, from their combined hazard."""
+        infection_radius = self.config.infection_radius
+        grid = self.build_grid(infection_radius)
+
+        # Every susceptible within range of an infected agent, with those infected agents and distances
+        contacts = {}
         for agent in self.agents:
             if agent.state == "I": 
-                    for other_agent in self.agents:
+                    for other_agent in self.nearby(grid, agent.position, infection_radius):
                         if other_agent.state == "S": 
                             distance = agent.position.distance_to(other_agent.position)
                             if distance <= infection_radius:
-                                # Proximity factor: closer agents have higher chance of infection
-                                proximity_factor = 1 - (distance / infection_radius)
-                                
-                                # Increment duration counter if agents stay close
-                                other_agent.proximity_duration += 1
-
-                                # Infection probability increases with time spent close
-                                aux_infection_probability = infection_probability + (proximity_factor * other_agent.proximity_duration)
-                                aux_infection_probability = min(0.8, aux_infection_probability)  # Cap at 100%
-
-                                if random.random() < aux_infection_probability:
-                                    other_agent.state = "I"
-                                    other_agent.update_state()
-                                    infection_rate += 1
-                                    other_agent.proximity_duration = 0  
-                            else:
-                                other_agent.proximity_duration = 0
+                                sources = contacts.get(other_agent)
+                                if sources is None:
+                                    sources = contacts[other_agent] = []
+                                sources.append((agent, distance))
+        entered, left = self.exposure.update(contacts, self.tick, self.clock.dt)
+        events = self.events
+        if events is not None and events.contacts:
+            for infector, susceptible in entered:
+                self.log_event(CONTACT_START, susceptible, infector)
+            for infector, susceptible in left:
+                self.log_event(CONTACT_END, susceptible, infector)
+
+        probability = self.config.infection_probability
+        for susceptible, chance in self.exposure.infection_chances(probability, infection_radius, self.clock):
+            if self.rng.random() < chance:
+                if events is not None:
+                    # Credit one infected neighbour, in proportion to its share of the hazard
+                    sources = self.exposure.contacts[susceptible]
+                    hazards = self.exposure.hazards(susceptible, probability, infection_radius, self.clock.frame)
+                    self.log_event(INFECTION, susceptible, sources[events.choose(hazards)][0])
+                self.set_state(susceptible, "I")
+                self.counters.infection_rate += 1
+                susceptible.proximity_duration = 0
 
     def handle_quarantine(self):
-        global successful_vax_rate
-        global failed_vax_rate
-        global recovery_rate
-        succes = False
-        self.quarantine.quarantine_delay += 1
-
-        for agent in self.quarantine.agents_in_quarantine:
-            if agent.time_in_quarantine >= agent.quarantine_time:
-                if random.random() < vaccination_succes_probability:
-                    succes = True
-                    successful_vax_rate += 1
-                    recovery_rate += 1
-                else:
-                    failed_vax_rate += 1
-        
-                self.quarantine.agents_in_quarantine.remove(agent)
-                agent.exit_quarantine(self.quarantine.rect, succes)
+        """Release every quarantined agent whose quarantine time is up, then keep others away from the zones."""
+        counters = self.counters
+        for zone in self.quarantine_zones:
+            zone.quarantine_delay += 1
+
+        for event, agent in self.releases.pop_due(self.tick):
+            if not agent.in_quarantine or agent.pending_release != event:
+                continue  # Died in quarantine before its release came due
+            agent.time_in_quarantine += (self.tick - agent.quarantined_since) * self.clock.dt
+
+            succes = self.rng.random() < self.config.vaccination_succes_probability
+            if succes:
+                counters.successful_vax_rate += 1
+                counters.recovery_rate += 1
             else:
-                agent.time_in_quarantine += 1
-
-        self.quarantine.steer_agents(self.agents)
-
-    def handle_death(self):
-        global death_count
-        global recovery_rate
-        for agent in self.agents:
-            if agent.state == "I":
-                agent.infection_timer += 1
-                if agent.infection_timer >= agent.recovery_duration:
-                    if random.random() < recovery_probability:
-                        recovery_rate += 1
-                        agent.state = "S"  
-                        agent.update_state()  
-                    else:
-                        self.agents.remove(agent)  
-                        death_count += 1
-    
-    def slow_down_infected_agents(self, slowdown_factor=slowdown):
-        for agent in self.agents:
-            if agent.state == "I" and agent.slowdown is False:  
-                agent.speed *= slowdown_factor  
-                agent.slowdown = True
-
-    def speed_up_recovered_agents(self, speedup_factor = speedup):
+                counters.failed_vax_rate += 1
+            self.log_event(VACCINATED if succes else VACCINATION_FAILED, agent)
+        
+            zone = agent.zone
+            zone.release(agent)
+            self.set_state(agent, "R" if succes else "S")
+            agent.exit_quarantine(zone.rect, succes)
+
+        # Steering nudges velocities once a tick, so a tick of several frames nudges that much harder
+        frames = self.clock.frames
+        # With a zone or two, checking them directly is cheaper than the per-agent cell lookup
+        if not self.spatial_index or len(self.quarantine_zones) <= 2:
+            for zone in self.quarantine_zones:
+                zone.steer_agents(self.agents, frames)
+            return
+
+        # Each agent only checks the zones indexed around it; an agent's velocity depends on nothing but
+        # the zones it meets, in zone order, so this matches steering zone by zone over all agents
+        lookup = self.zone_index.lookup
         for agent in self.agents:
-            if agent.state == "R" and agent.speedup is False:  
-                agent.speed *= speedup_factor  
-                agent.speedup = True
+            for zone in lookup(agent.position):
+                if zone.repels(agent):
+                    zone.steer_away(agent, frames)
 
+    def handle_death(self):
+        """Resolve every infection whose recovery check comes due this tick: recover to S or die."""
+        counters = self.counters
+        for event, agent in self.recovery_checks.pop_due(self.tick):
+            if agent.state != "I" or agent.pending_check != event:
+                continue  # Left the infected state through quarantine first
+            agent.infection_timer += self.clock.dt  # This tick's pass counts towards the infection
+
+            if self.rng.random() < self.config.recovery_probability:
+                counters.recovery_rate += 1
+                self.log_event(RECOVERY, agent)
+                self.set_state(agent, "S")
+            else:
+                self.log_event(DEATH, agent)
+                self.agents.remove(agent)  
+                self.recorder.transition("I", None)
+                counters.death_count += 1
+                if agent.in_quarantine:
+                    # The dead leave the quarantine with nothing left to vaccinate
+                    agent.zone.release(agent)
 
     def draw_legend(self):
-    
-        infect_text = FONT.render('Infect Random Agent: Press Q', True, BLACK)
-        sus_text = FONT.render('Add Susceptible Agent: Press Z', True, BLACK)
-        infection_probability_text = FONT.render(f'Infection Rate: {infection_probability:.2f}', True, BLACK)
-        recovery_probability_text = FONT.render(f'Recovery Rate: {recovery_probability:.2f}', True, BLACK)
-        vaccination_rate_text = FONT.render(f'Vax Succes Rate: {vaccination_succes_probability:.2f}', True, BLACK)
-        death_count_text = FONT.render(f'Death count: {death_count}',True, BLACK)
-        total_count_text = FONT.render(f'Agent count: {len(self.agents)}', True, BLACK )
-
-        screen.blit(infect_text, (20, 10))
-        screen.blit(sus_text,(20,30))
-        screen.blit(infection_probability_text, (20, 730))
-        screen.blit(recovery_probability_text, (20, 750))
-        screen.blit(vaccination_rate_text, (20, 770))
-        screen.blit(death_count_text, (SCREEN_WIDTH - 140, SCREEN_HEIGHT - 30))
-        screen.blit(total_count_text, (SCREEN_WIDTH - 160, SCREEN_HEIGHT - 50))
+        # Text surfaces are cached by the renderer, so only lines whose values changed get re-rendered
+        renderer.draw_text('Infect Random Agent: Press Q', BLACK, (20, 10))
+        renderer.draw_text('Add Susceptible Agent: Press Z', BLACK, (20, 30))
+        renderer.draw_text(f'Infection Rate: {self.config.infection_probability:.2f}', BLACK, (20, 730))
+        renderer.draw_text(f'Recovery Rate: {self.config.recovery_probability:.2f}', BLACK, (20, 750))
+        renderer.draw_text(f'Vax Succes Rate: {self.config.vaccination_succes_probability:.2f}', BLACK, (20, 770))
+        renderer.draw_text(f'Death count: {self.counters.death_count}', BLACK, (SCREEN_WIDTH - 140, SCREEN_HEIGHT - 30))
+        renderer.draw_text(f'Agent count: {len(self.agents)}', BLACK, (SCREEN_WIDTH - 160, SCREEN_HEIGHT - 50))
+        coarse = ' (coarse ticks)' if self.clock.dt != self.clock.frame else ''
+        renderer.draw_text(f'Time: {self.clock.time:.1f} s x{self.time_scale:g}{coarse}', BLACK, (20, 710))
+        if self.render_every > 1:
+            renderer.draw_text(f'Drawing every {self.render_every} frames', BLACK, (SCREEN_WIDTH - 200, SCREEN_HEIGHT - 70))
         
+    def draw_performance(self):
+        """Overlay with the actual frame rate against the FPS target and the mean time of each phase."""
+        lines = [f'FPS: {clock.get_fps():.1f} / {FPS}', f'Ticks/s: {self.profiler.ticks_per_second():.1f}']
+        lines += [f'{phase}: {timing["mean_ms"]:.2f} ms' for phase, timing in self.profiler.summary().items()]
 
-    def render(self):
-        
+        for row, line in enumerate(lines):
+            renderer.draw_text(line, BLACK, (SCREEN_WIDTH - 260, 10 + 20 * row))
+
+    def render(self, previous = None, alpha = 1.0):
+        """Draw the current frame, with agents placed alpha of the way from their previous positions."""
         screen.fill(WHITE)
 
         self.draw_legend()
+        if self.profiler is not None:
+            self.draw_performance()
 
-        for agent in self.agents:
-             agent.update_state()
-             agent.draw()
+        renderer.draw_agents(self.agents, self.config, previous, alpha)
 
-        self.quarantine.draw()
+        for zone in self.quarantine_zones:
+            zone.draw()
 
-        track_history(self.agents, self.stats)
         pygame.display.flip()        
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+import os
+import queue
+import threading
+
+import numpy as np
+
+# One record per event, written back to back. agent and source are agent ids (Agent.uid, or the row
+# of an ArrayPopulation); source is the infector for infections and contacts and -1 otherwise.
+# x and y are where the agent was.
+EVENT_DTYPE = np.dtype([("tick", "<i8"), ("kind", "i1"), ("agent", "<i8"), ("source", "<i8"),
+                        ("x", "<f4"), ("y", "<f4")])
+
+# Event kinds
+INFECTION, RECOVERY, DEATH, QUARANTINE_ENTRY, VACCINATED, VACCINATION_FAILED, CONTACT_START, CONTACT_END = range(8)
+EVENT_KINDS = ("infection", "recovery", "death", "quarantine_entry", "vaccinated", "vaccination_failed",
+               "contact_start", "contact_end")
+
+
+class EventLog:
+    """Append-only stream of simulation events, written to a raw binary file by a background thread.
+
+    Events are collected in a preallocated batch of EVENT_DTYPE records; a full batch is handed to the
+    writer thread and a new one started, so the tick loop never waits on the disk. The file is nothing
+    but the records, and load_events() memory-maps it. close() (or leaving a with block) writes out
+    what is still buffered.
+
+    Infections with several infected neighbours are attributed to one of them at random, in proportion
+    to its share of the hazard; those draws come from the log's own generator, so logging leaves the
+    simulation's random stream alone. With contacts set, the start and end of every contact between an
+    infected and a susceptible agent are logged as well (Simulation only).
+    """
+
+    def __init__(self, path, batch_size=65536, contacts=False, seed=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.contacts = contacts
+        self.rng = np.random.default_rng(seed)
+        self.batch = np.empty(batch_size, dtype=EVENT_DTYPE)
+        self.size = 0
+        self.logged = 0
+        self.error = None
+
+        open(path, "wb").close()
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_batches, name="event-writer", daemon=True)
+        self.writer.start()
+
+    def __len__(self):
+        return self.logged + self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def log(self, tick, kind, agent, source=-1, position=None):
+        """Log one event; position is any (x, y) pair, or None when it does not apply."""
+        if self.size == self.batch_size:
+            self.flush()
+        x, y = position if position is not None else (np.nan, np.nan)
+        self.batch[self.size] = (tick, kind, agent, source, x, y)
+        self.size += 1
+
+    def log_many(self, tick, kind, agents, sources=-1, positions=None):
+        """Log one event per agent in a few array copies; sources is an array or one id for all of them."""
+        agents = np.asarray(agents)
+        start = 0
+        while start < len(agents):
+            if self.size == self.batch_size:
+                self.flush()
+            stop = start + min(len(agents) - start, self.batch_size - self.size)
+            rows = self.batch[self.size:self.size + stop - start]
+            rows["tick"] = tick
+            rows["kind"] = kind
+            rows["agent"] = agents[start:stop]
+            rows["source"] = sources if np.ndim(sources) == 0 else sources[start:stop]
+            if positions is None:
+                rows["x"] = rows["y"] = np.nan
+            else:
+                rows["x"], rows["y"] = positions[start:stop, 0], positions[start:stop, 1]
+            self.size += stop - start
+            start = stop
+
+    def choose(self, weights):
+        """Index of one of weights, drawn in proportion to them."""
+        if len(weights) == 1:
+            return 0
+        cumulative = np.cumsum(weights)
+        return min(int(np.searchsorted(cumulative, self.rng.random() * cumulative[-1], side="right")), len(weights) - 1)
+
+    def flush(self):
+        """Hand the buffered events to the writer thread and start a new batch."""
+        if self.error is not None:
+            raise RuntimeError(f"Writing {self.path} failed") from self.error
+        if self.size:
+            self.queue.put(self.batch[:self.size])
+            self.logged += self.size
+            self.batch = np.empty(self.batch_size, dtype=EVENT_DTYPE)
+            self.size = 0
+
+    def sync(self):
+        """Flush and wait until everything logged so far is on disk, e.g. to load the file mid-run."""
+        self.flush()
+        self.queue.join()
+
+    def close(self):
+        if self.writer.is_alive():
+            self.flush()
+            self.queue.put(None)
+            self.writer.join()
+        if self.error is not None:
+            raise RuntimeError(f"Writing {self.path} failed") from self.error
+
+    def write_batches(self):
+        with open(self.path, "ab") as stream:
+            while True:
+                batch = self.queue.get()
+                try:
+                    if batch is None:
+                        return
+                    if self.error is None:
+                        batch.tofile(stream)
+                        stream.flush()
+                except OSError as error:
+                    self.error = error
+                finally:
+                    self.queue.task_done()
+
+
+def load_events(path):
+    """Memory-map an event file written by EventLog."""
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    return np.memmap(path, dtype=EVENT_DTYPE, mode="r")
+
+
+def transmission_tree(events):
+    """Who infected whom, as one row per infection event in log order.
+
+    Returns a dict of arrays: tick, agent, source (-1 for seeded or introduced infections), parent (the
+    row of the source's own infection that was running at the time, -1 if none is logged), generation
+    (0 for roots) and offspring (infections caused). Agents can be infected more than once, so an
+    infection is linked to the source's latest infection at or before its tick.
+    """
+    infections = events[events["kind"] == INFECTION]
+    tick = np.asarray(infections["tick"])
+    agent = np.asarray(infections["agent"])
+    source = np.asarray(infections["source"])
+    count = len(infections)
+    if count == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return {"tick": empty, "agent": empty, "source": empty, "parent": empty, "generation": empty,
+                "offspring": empty}
+
+    # Infections sorted by (agent, tick), so the latest infection of a source up to a tick is one search away
+    span = int(tick.max()) + 1
+    keys = agent * span + tick
+    order = np.argsort(keys, kind="stable")
+    found = order[np.maximum(np.searchsorted(keys[order], source * span + tick, side="right") - 1, 0)]
+    parent = np.where((source >= 0) & (agent[found] == source), found, -1)
+
+    # A parent is always logged before its children, so list ranking terminates in log2(depth) rounds
+    generation = (parent >= 0).astype(np.int64)
+    jump = parent.copy()
+    while np.any(jump >= 0):
+        linked = jump >= 0
+        generation = np.where(linked, generation + generation[np.maximum(jump, 0)], generation)
+        jump = np.where(linked, jump[np.maximum(jump, 0)], -1)
+
+    offspring = np.bincount(parent[parent >= 0], minlength=count)
+    return {"tick": tick, "agent": agent, "source": source, "parent": parent, "generation": generation,
+            "offspring": offspring}
+
+
+def reproduction_numbers(events, bin_ticks=1, tree=None):
+    """Case reproduction number over time: the mean number of infections caused by those infected in each bin.
+
+    Returns a dict with the first tick of every bin of bin_ticks ticks, the infections in it and their
+    mean offspring (NaN for bins without infections). Infections near the end of the log have not run
+    their course yet, so the last bins understate R.
+    """
+    tree = tree or transmission_tree(events)
+    bins = tree["tick"] // bin_ticks
+    length = int(bins.max()) + 1 if len(bins) else 0
+    infections = np.bincount(bins, minlength=length)
+    caused = np.bincount(bins, weights=tree["offspring"], minlength=length)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        reproduction = np.where(infections > 0, caused / infections, np.nan)
+    return {"tick": np.arange(length) * bin_ticks, "infections": infections, "R": reproduction}
+
+
+def contact_network(events):
+    """Contacts between infected and susceptible agents, from the contact events of a log.
+
+    Returns a dict of arrays with one row per contact: source (the infected agent), agent (the
+    susceptible), start and end ticks, where end is -1 for contacts still open when the log ends.
+    """
+    contacts = events[(events["kind"] == CONTACT_START) | (events["kind"] == CONTACT_END)]
+    agent = np.asarray(contacts["agent"])
+    source = np.asarray(contacts["source"])
+    tick = np.asarray(contacts["tick"])
+    kind = np.asarray(contacts["kind"])
+
+    # Every pair's events in time order; each start is followed by its end unless the contact is still open
+    order = np.lexsort((np.arange(len(contacts)), tick, source, agent))
+    agent, source, tick, kind = agent[order], source[order], tick[order], kind[order]
+    starts = np.flatnonzero(kind == CONTACT_START)
+    following = np.minimum(starts + 1, max(len(kind) - 1, 0))
+    closed = ((starts + 1 < len(kind)) & (kind[following] == CONTACT_END)
+              & (agent[following] == agent[starts]) & (source[following] == source[starts]))
+    return {"source": source[starts], "agent": agent[starts], "start": tick[starts],
+            "end": np.where(closed, tick[following], -1)}
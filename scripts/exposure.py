@@ -0,0 +1,73 @@
+import math
+
+# Highest chance per frame of catching the infection from one infected neighbour
+MAX_INFECTION_CHANCE = 0.8
+
+
+class ExposureTracker:
+    """Contacts between infected and susceptible agents, carried over from tick to tick.
+
+    update() takes the pairs within infection radius found by this tick's neighbour queries, and only
+    the pairs that came into or went out of range change the bookkeeping. A susceptible's exposure
+    (its proximity_duration, in simulated seconds) builds up while any infected agent is in range and
+    is reset once none is, so it no longer depends on the order the agents are visited in.
+    infection_chances() then combines the hazards of all infected neighbours of a susceptible into one
+    chance per tick.
+    """
+
+    def __init__(self):
+        # (infector, susceptible) -> tick the contact started, in the order the contacts were found
+        self.pairs = {}
+        # Susceptible -> [(infector, distance)] of the last update, in the order they were found
+        self.contacts = {}
+
+    def update(self, contacts, tick, dt):
+        """Take this tick's contacts and return the (infector, susceptible) pairs that came into and went out of range."""
+        previous = self.pairs
+        pairs = {}
+        entered = []
+        for susceptible, sources in contacts.items():
+            susceptible.proximity_duration += dt
+            for infector, _ in sources:
+                key = (infector, susceptible)
+                start = previous.pop(key, None)
+                if start is None:
+                    start = tick
+                    entered.append(key)
+                pairs[key] = start
+
+        # Whatever is left went out of range, or one of its agents changed state or died
+        left = list(previous)
+        for susceptible in self.contacts:
+            if susceptible not in contacts:
+                susceptible.proximity_duration = 0
+
+        self.pairs = pairs
+        self.contacts = contacts
+        return entered, left
+
+    def infection_chances(self, base_probability, radius, clock):
+        """Yield (susceptible, chance of infection this tick) for every susceptible in contact, in contact order.
+
+        Each infected neighbour contributes a chance per frame that grows with closeness and with the
+        susceptible's exposure so far; the chances combine as independent hazards and compound over the
+        frames of the tick.
+        """
+        frames, frame = clock.frames, clock.frame
+        for susceptible in self.contacts:
+            yield susceptible, -math.expm1(-sum(self.hazards(susceptible, base_probability, radius, frame)) * frames)
+
+    def hazards(self, susceptible, base_probability, radius, frame):
+        """Hazard per frame (minus the log of the chance to escape it) from each infected neighbour of susceptible."""
+        exposure = susceptible.proximity_duration / frame
+        hazards = []
+        for _, distance in self.contacts[susceptible]:
+            # Proximity factor: closer agents have higher chance of infection
+            proximity_factor = 1 - (distance / radius)
+            hazards.append(-math.log1p(-min(MAX_INFECTION_CHANCE, base_probability + proximity_factor * exposure)))
+        return hazards
+
+    def restore(self, pairs, exposed):
+        """Reload contact pairs with their start ticks and the susceptibles that were in contact last tick."""
+        self.pairs = dict(pairs)
+        self.contacts = {susceptible: [] for susceptible in exposed}
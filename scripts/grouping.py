@@ -0,0 +1,120 @@
+import math
+
+import numpy as np
+
+# Neighbour cells, as (dx, dy) key offsets, that can hold a point closer than radius to a point of the
+# current cell when cells are radius / sqrt(2) wide; each unordered pair of cells is listed once
+NEIGHBOUR_OFFSETS = [(dx, dy) for dx in range(0, 3) for dy in range(-2, 3)
+                     if (dx, dy) > (0, 0) and not (abs(dx) == 2 and abs(dy) == 2)]
+
+# Points compared per cell pair before falling back to every pair; in crowded areas a few are
+# nearly always enough to link neighbouring cells
+SAMPLE_POINTS = 4
+
+
+class Group:
+    """A connected cluster of infected pro-vax agents found in one tick.
+
+    members are Agent objects for Simulation and agent indices for ArrayPopulation; center is the
+    centroid of their positions.
+    """
+
+    def __init__(self, members, center):
+        self.members = members
+        self.center = center
+
+    @property
+    def size(self):
+        return len(self.members)
+
+
+def connected_components(count, i, j):
+    """Label the connected components of the graph on count nodes with edge arrays (i, j).
+
+    Vectorized union-find: every round each edge hooks the root of its larger endpoint under the
+    smaller one, then pointer jumping flattens the trees, so the number of rounds grows with the log of
+    the component size rather than with the number of edges. Components are numbered in order of
+    their lowest node.
+    """
+    labels = np.arange(count)
+    while True:
+        roots_i, roots_j = labels[i], labels[j]
+        lower = np.minimum(roots_i, roots_j)
+        hooked = labels.copy()
+        np.minimum.at(hooked, roots_i, lower)
+        np.minimum.at(hooked, roots_j, lower)
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            break
+        labels = hooked
+
+    return np.unique(labels, return_inverse=True)[1].reshape(-1)
+
+
+def cluster(points, radius):
+    """Single-linkage clusters of points (n, 2) chained by pairs closer than radius.
+
+    Returns (labels, sizes, centers): the cluster of every point (numbered in order of their first
+    point), the size of every cluster and its centroid.
+
+    Points are bucketed on a grid of cells radius / sqrt(2) wide, so all points sharing a cell are
+    already linked and the union-find runs over occupied cells. Two neighbouring cells are linked
+    once any pair of their points is; a few points per cell are tried first and all pairs only for
+    cell pairs still unlinked after that. The cost stays near-linear in the number of points, where
+    listing every close pair would grow with the square of the local density.
+    """
+    count = len(points)
+    if count == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros((0, 2))
+
+    # Shrunk a little so rounding can never put two points of one cell radius or more apart
+    size = radius / math.sqrt(2) * (1 - 1e-9)
+    cells = np.floor(points / size).astype(np.int64)
+    cells -= cells.min(axis=0) - 2
+    stride = cells[:, 1].max() + 3
+    keys, point_cell, cell_counts = np.unique(cells[:, 0] * stride + cells[:, 1],
+                                              return_inverse=True, return_counts=True)
+    point_cell = point_cell.reshape(-1)
+    order = np.argsort(point_cell, kind="stable")
+    cell_starts = np.cumsum(cell_counts) - cell_counts
+
+    first, second = [], []
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        target = keys + dx * stride + dy
+        found = np.minimum(np.searchsorted(keys, target), len(keys) - 1)
+        occupied = keys[found] == target
+        first.append(np.flatnonzero(occupied))
+        second.append(found[occupied])
+    first, second = np.concatenate(first), np.concatenate(second)
+
+    def linked(a, b, sample=None):
+        """For cell pairs (a, b), whether any compared pair of their points is closer than radius."""
+        counts_a, counts_b = cell_counts[a], cell_counts[b]
+        if sample is not None:
+            counts_a, counts_b = np.minimum(counts_a, sample), np.minimum(counts_b, sample)
+        pairs = counts_a * counts_b
+        pair = np.repeat(np.arange(len(a)), pairs)
+        offset = np.arange(pairs.sum()) - np.repeat(np.cumsum(pairs) - pairs, pairs)
+        i = order[cell_starts[a][pair] + offset // counts_b[pair]]
+        j = order[cell_starts[b][pair] + offset % counts_b[pair]]
+        close = np.hypot(points[i, 0] - points[j, 0], points[i, 1] - points[j, 1]) < radius
+        return np.bincount(pair[close], minlength=len(a)) > 0
+
+    link = linked(first, second, SAMPLE_POINTS)
+    cell_labels = connected_components(len(keys), first[link], second[link])
+    unresolved = np.flatnonzero(~link & (cell_labels[first] != cell_labels[second]))
+    if len(unresolved):
+        link[unresolved] = linked(first[unresolved], second[unresolved])
+        cell_labels = connected_components(len(keys), first[link], second[link])
+
+    # Renumber the clusters in order of their first point
+    labels = cell_labels[point_cell]
+    _, first_point, labels = np.unique(labels, return_index=True, return_inverse=True)
+    labels = np.argsort(np.argsort(first_point))[labels.reshape(-1)]
+    sizes = np.bincount(labels)
+    centers = np.column_stack((np.bincount(labels, weights=points[:, 0]), np.bincount(labels, weights=points[:, 1])))
+    return labels, sizes, centers / sizes[:, None]
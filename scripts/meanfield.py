@@ -0,0 +1,314 @@
+import math
+
+import numpy as np
+
+import epidemic_sim as defaults
+from clock import COARSE_DT, SimulationClock
+from epidemic_sim import Counters, SimulationConfig, document_probabilities
+from exposure import MAX_INFECTION_CHANCE
+from population import DEAD, INFECTED, RECOVERED, SUSCEPTIBLE, ArrayPopulation, world_size
+from recorder import STAT_FIELDS
+
+# Knobs that can be given one value per parameter set
+PARAMETERS = ("infection_probability", "recovery_probability", "vaccination_succes_probability", "vaccination_rate",
+              "infection_radius", "grouping_radius", "slowdown")
+
+# Population size above which hybrid_model() stops simulating individual agents
+HYBRID_AGENT_LIMIT = 500_000
+
+# Infections and quarantine stays last a uniform number of seconds in the agent model; a chain of
+# exponential stages gives a delay with the same mean and about the same spread
+INFECTION_SECONDS, INFECTION_STAGES = 7.5, 27
+QUARANTINE_SECONDS, QUARANTINE_STAGES = 20, 12
+# Stages of the trip of a grouped pro-vaxxer to the quarantine zone
+TRAVEL_STAGES = 4
+
+# Share of the well-mixed contact rate seen in the agent model, where the infection spreads outwards
+# from where it started and the susceptibles next to infected agents are the first to be used up.
+# Fitted, not derived: the least-squares fit of the infected curve to the mean of 40 seeded
+# ArrayPopulation runs of the default setup over 4000 frames (test_meanfield.py checks the fit)
+MIXING = 0.4
+# Mean closeness (1 - distance / infection_radius) of a point drawn uniformly inside the infection radius
+MEAN_PROXIMITY = 1 / 3
+
+
+def relative_speed(speed):
+    """Mean relative speed of a unit-speed agent and one moving at speed, in uniformly random directions."""
+    angles = (np.arange(256) + 0.5) * math.pi / 256
+    speed = np.asarray(speed, dtype=float)[..., None]
+    return np.sqrt(1 + speed ** 2 - 2 * speed * np.cos(angles)).mean(axis=-1)
+
+
+def encounter_chance(infection_probability, ticks):
+    """Chance that one pass through an infected agent's radius, lasting ticks, ends in infection.
+
+    The per-tick chance grows with the time spent in range, as in the agent model.
+    """
+    time = np.arange(1, int(max(np.max(ticks), 1)) + 1)
+    chance = np.minimum(MAX_INFECTION_CHANCE, infection_probability[:, None] + MEAN_PROXIMITY * time)
+    chance = np.where(time <= ticks[:, None], chance, 0.0)
+    return 1 - np.prod(1 - chance, axis=1)
+
+
+def hybrid_model(num_agents=defaults.no_agents, num_infected=defaults.no_infected, seed=None, config=None,
+                 max_agents=HYBRID_AGENT_LIMIT, dt=None, width=None, height=None):
+    """ArrayPopulation for populations up to max_agents, MeanFieldModel for anything larger; both step dt seconds.
+
+    The world is sized by world_size() unless given, so both engines see the default agent density at any size.
+    """
+    if width is None or height is None:
+        width, height = world_size(num_agents)
+    if num_agents > max_agents:
+        return MeanFieldModel(num_agents, num_infected, width, height, config=config, dt=dt)
+    return ArrayPopulation(num_agents, num_infected, width, height, seed=seed, config=config, dt=dt)
+
+
+class MeanFieldModel:
+    """Compartmental version of the agent model, for what-if questions that need an answer at once.
+
+    The agents are replaced by expected head counts: free susceptible and infected pro- and anti-vaxxers,
+    infected and cleared agents in quarantine, recovered and dead, with the infection and quarantine
+    clocks as chains of stages. As in the agent model the infection clock is never reset, so agents
+    that already went through an infection ("spent" susceptibles) resolve any later one right away. Contact rates follow from the density of the world, the radii and the
+    agent speeds, so the model takes the same knobs as Simulation. Every knob in PARAMETERS can be given
+    as an array, in which case that many parameter sets are integrated side by side in one set of
+    vectorized updates.
+
+    Stats rows have the STAT_FIELDS layout of track_history (as expected values, so floats) and go
+    straight into plot_population_stats; with several parameter sets they are shaped (steps, sets, fields).
+    Every step covers dt simulated seconds, COARSE_DT by default so that a what-if run takes a few hundred
+    steps; dt=None steps one frame like the agent engines.
+    """
+
+    def __init__(self, num_agents=defaults.no_agents, num_infected=defaults.no_infected,
+                 width=defaults.SCREEN_WIDTH, height=defaults.SCREEN_HEIGHT, config=None, parameters=None,
+                 withDataset=False, dt=COARSE_DT):
+        self.config = config or SimulationConfig()
+        if withDataset:
+            document_probabilities(self.config)
+        values = {name: np.atleast_1d(np.asarray((parameters or {}).get(name, getattr(self.config, name)), dtype=float))
+                  for name in PARAMETERS}
+        self.sets = max(len(value) for value in values.values())
+        values = {name: np.broadcast_to(value, self.sets).copy() for name, value in values.items()}
+        self.parameters = values
+        self.num_agents = num_agents
+        self.width, self.height = width, height
+        self.clock = SimulationClock(1 / defaults.FPS, dt)
+        self.tick = 0
+
+        # Contacts: new infected agents met per frame by a susceptible, per infected agent in the world
+        area = width * height
+        speed = relative_speed(values["slowdown"])
+        radius = values["infection_radius"]
+        encounter_ticks = np.maximum(1, np.round(math.pi * radius / 2 / speed))
+        self.contact_rate = MIXING * 2 * radius * speed * encounter_chance(values["infection_probability"], encounter_ticks) / area
+        self.infection_area = math.pi * radius ** 2 / area
+        self.contact_chance = np.minimum(MAX_INFECTION_CHANCE, values["infection_probability"] + MEAN_PROXIMITY)
+        self.grouping_area = math.pi * values["grouping_radius"] ** 2 / area
+
+        # Grouped pro-vaxxers head straight for the zone at the slowed-down speed of the infected; the zone
+        # is the first of Simulation's default ones, as in ArrayPopulation
+        x, y, zone_width, zone_height, self.quarantine_capacity = defaults.default_zone_layout(width, height)[0]
+        grid_x, grid_y = np.meshgrid(np.linspace(0, width, 64), np.linspace(0, height, 64))
+        distance = np.hypot(grid_x - (x + zone_width // 2), grid_y - (y + zone_height // 2)).mean()
+
+        # Share of every stage that moves on to the next one in a step: its rate times the step, so that a
+        # stage lasts 1 / rate on average however long the step (1 - exp(-rate dt), the chance of leaving
+        # within a step of a continuous stage, would make every stage last longer on coarse steps)
+        dt, frames = self.clock.dt, self.clock.frames
+        self.infection_move = min(1.0, dt * INFECTION_STAGES / INFECTION_SECONDS)
+        self.quarantine_move = min(1.0, dt * QUARANTINE_STAGES / QUARANTINE_SECONDS)
+        self.travel_move = np.minimum(1.0, frames * TRAVEL_STAGES * values["slowdown"] / distance)[:, None, None]
+
+        sets = self.sets
+        pro = values["vaccination_rate"]
+        self.susceptible_pro = (num_agents - num_infected) * pro
+        self.susceptible_anti = (num_agents - num_infected) * (1 - pro)
+        self.spent_pro = np.zeros(sets)
+        self.spent_anti = np.zeros(sets)
+        # Infection clocks of free pro- and anti-vaxxers, of agents in quarantine and of grouped agents on
+        # their way there (one row per stage of the trip), all in one array so they move in one update
+        self.infections = np.zeros((sets, 3 + TRAVEL_STAGES, INFECTION_STAGES))
+        self.infected_pro, self.infected_anti, self.infected_quarantined = (self.infections[:, row] for row in range(3))
+        self.heading = self.infections[:, 3:]
+        self.infected_pro[:, 0] = num_infected * pro
+        self.infected_anti[:, 0] = num_infected * (1 - pro)
+        self.quarantined = np.zeros((sets, QUARANTINE_STAGES))
+        self.recovered = np.zeros(sets)
+        self.dead = np.zeros(sets)
+        # Counters with one expected count per parameter set
+        self.counters = Counters()
+        for field in STAT_FIELDS[3:]:
+            setattr(self.counters, field, np.zeros(sets))
+        self.counters.infection_rate += num_infected
+        self.rows = []
+
+        # Agents start at uniform random positions, so some susceptibles start out within infection range
+        # of a seeded agent; they stay in range for dozens of frames at a chance per frame that soon
+        # reaches MAX_INFECTION_CHANCE, so they are taken to catch it at once
+        overlap = -np.expm1(-num_infected * self.infection_area)
+        for susceptible, infected in ((self.susceptible_pro, self.infected_pro), (self.susceptible_anti, self.infected_anti)):
+            caught = susceptible * overlap
+            susceptible -= caught
+            infected[:, 0] += caught
+            self.counters.infection_rate += caught
+
+    @classmethod
+    def from_population(cls, population, dt=None):
+        """Continue an ArrayPopulation as a mean-field model, from its current agents and counters; dt
+        defaults to the population's."""
+        model = cls(0, 0, population.width, population.height, population.config,
+                    dt=population.clock.dt if dt is None else dt)
+        state, alive = population.state, population.state != DEAD
+        quarantined, pro = population.in_quarantine & alive, population.will_vax
+        free = ~quarantined
+
+        def stages(mask, elapsed, total, count):
+            stage = np.minimum(count - 1, (count * elapsed[mask] / total[mask]).astype(np.intp))
+            return np.bincount(stage, minlength=count)[None, :].astype(float)
+
+        infection = (population.infection_timer, population.recovery_duration, INFECTION_STAGES)
+        model.num_agents = len(population)
+        susceptible = (state == SUSCEPTIBLE) & free
+        spent = population.infection_timer >= population.recovery_duration
+        model.susceptible_pro = np.array([float(np.sum(susceptible & ~spent & pro))])
+        model.susceptible_anti = np.array([float(np.sum(susceptible & ~spent & ~pro))])
+        model.spent_pro = np.array([float(np.sum(susceptible & spent & pro))])
+        model.spent_anti = np.array([float(np.sum(susceptible & spent & ~pro))])
+        model.infected_pro[:] = stages((state == INFECTED) & free & pro, *infection)
+        model.infected_anti[:] = stages((state == INFECTED) & free & ~pro, *infection)
+        model.infected_quarantined[:] = stages((state == INFECTED) & quarantined, *infection)
+        model.quarantined = stages(quarantined, population.time_in_quarantine, population.quarantine_time,
+                                   QUARANTINE_STAGES)
+        model.recovered = np.array([float(np.sum(state == RECOVERED))])
+        model.dead = np.array([float(np.sum(state == DEAD))])
+        for field in STAT_FIELDS[3:]:
+            setattr(model.counters, field, np.array([float(getattr(population.counters, field))]))
+        model.quarantine_capacity = population.quarantine_capacity
+        model.tick = population.tick
+        model.clock.time = population.clock.time
+        return model
+
+    def __len__(self):
+        return self.num_agents
+
+    def counts(self):
+        """Expected (susceptible, infected, recovered) head counts of every parameter set."""
+        infected_quarantined = self.infected_quarantined.sum(axis=1)
+        susceptible = (self.susceptible_pro + self.susceptible_anti + self.spent_pro + self.spent_anti
+                       + self.quarantined.sum(axis=1) - infected_quarantined)
+        infected = self.free_infected() + infected_quarantined
+        return susceptible, infected, self.recovered
+
+    def free_infected(self):
+        return self.infections.sum(axis=(1, 2)) - self.infected_quarantined.sum(axis=1)
+
+    def step(self, n=1):
+        """Advance every parameter set by n steps of dt seconds each, recording one stats row per step."""
+        for _ in range(n):
+            self.advance()
+            self.tick += 1
+            self.clock.advance()
+            self.rows.append(np.array(self.counts() + tuple(getattr(self.counters, field) for field in STAT_FIELDS[3:])).T)
+
+    def run_steps(self, n):
+        self.step(n)
+        return self.stats
+
+    @property
+    def stats(self):
+        """Recorded rows, (steps, fields) for one parameter set and (steps, sets, fields) for several."""
+        rows = np.array(self.rows).reshape(-1, self.sets, len(STAT_FIELDS))
+        return rows[:, 0] if self.sets == 1 else rows
+
+    def advance(self):
+        """Move the expected head counts along every transition for one step of dt seconds."""
+        frames, values, counters = self.clock.frames, self.parameters, self.counters
+
+        # Infections, driven by the infected agents that are free to move
+        free_infected = self.free_infected()
+        infection = -np.expm1(-frames * self.contact_rate * free_infected)
+        new_pro, new_anti = self.susceptible_pro * infection, self.susceptible_anti * infection
+        self.susceptible_pro -= new_pro
+        self.susceptible_anti -= new_anti
+        counters.infection_rate += new_pro + new_anti
+
+        # Spent agents get over a new infection within the tick, so they are never counted as infected
+        recovery = values["recovery_probability"]
+        exposure = self.clock.chance(-np.expm1(-free_infected * self.infection_area) * self.contact_chance)
+        for spent in (self.spent_pro, self.spent_anti):
+            reinfected = spent * exposure
+            spent -= reinfected * (1 - recovery)
+            self.dead += reinfected * (1 - recovery)
+            counters.infection_rate += reinfected
+            counters.recovery_rate += reinfected * recovery
+            counters.death_count += reinfected * (1 - recovery)
+
+        # Infected pro-vaxxers with another one within grouping_radius head for the quarantine zone, staying
+        # infectious on the way; the trip takes about as long as crossing the world at the infected speed
+        pro_infected = self.infected_pro.sum(axis=1) + self.heading.sum(axis=(1, 2))
+        grouping = self.infected_pro * -np.expm1(-pro_infected * self.grouping_area * frames)[:, None]
+        self.infected_pro -= grouping
+        self.heading[:, 0] += grouping
+        moving = self.heading * self.travel_move
+        self.heading -= moving
+        self.heading[:, 1:] += moving[:, :-1]
+        arriving = moving[:, -1]
+        if self.quarantine_capacity is not None:
+            # A full zone turns the excess away; it waits at the end of the trip for room
+            room = np.maximum(0, self.quarantine_capacity - self.quarantined.sum(axis=1))
+            admitted = np.minimum(1, room / np.maximum(arriving.sum(axis=1), 1e-12))[:, None]
+            self.heading[:, -1] += arriving * (1 - admitted)
+            arriving = arriving * admitted
+        self.infected_quarantined += arriving
+        self.quarantined[:, 0] += arriving.sum(axis=1)
+
+        # Agents in quarantine sit within infection range of each other, so the ones that got over their
+        # infection there keep catching it again from those still infected, like spent agents outside
+        infected_quarantined = self.infected_quarantined.sum(axis=1)
+        cleared = self.quarantined.sum(axis=1) - infected_quarantined
+        reinfected = cleared * self.clock.chance(-np.expm1(-infected_quarantined) * self.contact_chance)
+        counters.infection_rate += reinfected
+        counters.recovery_rate += reinfected * recovery
+        counters.death_count += reinfected * (1 - recovery)
+        self.dead += reinfected * (1 - recovery)
+        self.quarantined *= self.leaving_share(reinfected * (1 - recovery), self.quarantined.sum(axis=1))[:, None]
+
+        # Infections run their course and end in recovery or death
+        moving = self.infections * self.infection_move
+        self.infections -= moving
+        self.infections[..., 1:] += moving[..., :-1]
+        ended = moving[..., -1]
+        resolved = [ended[:, 0], ended[:, 1], ended[:, 2], ended[:, 3:].sum(axis=1)]
+        self.infected_pro[:, 0] += new_pro
+        self.infected_anti[:, 0] += new_anti
+        # Pro-vaxxers that get over it on the way stop where they are
+        self.spent_pro += (resolved[0] + resolved[3]) * recovery
+        self.spent_anti += resolved[1] * recovery
+        counters.recovery_rate += sum(resolved) * recovery
+        deaths = sum(resolved) * (1 - recovery)
+        self.dead += deaths
+        counters.death_count += deaths
+
+        # The dead leave quarantine evenly across its stages; recovered agents stay until released
+        staying = self.quarantined.sum(axis=1)
+        self.quarantined *= self.leaving_share(resolved[2] * (1 - recovery), staying)[:, None]
+
+        # Releases, vaccinating everyone who leaves, infected or not
+        moving = self.quarantined * self.quarantine_move
+        self.quarantined -= moving
+        self.quarantined[:, 1:] += moving[:, :-1]
+        released = moving[:, -1]
+        self.infected_quarantined *= self.leaving_share(released, staying - resolved[2] * (1 - recovery))[:, None]
+        success = released * values["vaccination_succes_probability"]
+        self.recovered += success
+        self.spent_anti += released - success
+        counters.successful_vax_rate += success
+        counters.recovery_rate += success
+        counters.failed_vax_rate += released - success
+
+    @staticmethod
+    def leaving_share(leaving, total):
+        """Share of a compartment left after leaving of its total head count go."""
+        total = np.asarray(total, dtype=float)
+        return 1 - np.divide(leaving, total, out=np.zeros_like(total), where=total > 0)
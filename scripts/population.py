@@ -0,0 +1,425 @@
+import math
+
+import numpy as np
+
+import epidemic_sim as defaults
+from checkpoint import read_snapshot, recorder_snapshot, restore_recorder, write_snapshot
+from clock import COARSE_DT, SimulationClock
+from epidemic_sim import Counters, SimulationConfig
+from events import DEATH, INFECTION, QUARANTINE_ENTRY, RECOVERY, VACCINATED, VACCINATION_FAILED
+from exposure import MAX_INFECTION_CHANCE
+from grouping import Group, cluster
+from recorder import StatsRecorder
+from spatial import grid_pairs
+
+# State codes stored in ArrayPopulation.state
+SUSCEPTIBLE, INFECTED, RECOVERED, DEAD = 0, 1, 2, 3
+STATE_CODES = {"S": SUSCEPTIBLE, "I": INFECTED, "R": RECOVERED}
+
+# Per-agent arrays, in the order allocate() creates them
+AGENT_ARRAYS = ("position", "velocity", "speed", "state", "infection_timer", "recovery_duration",
+                "proximity_duration", "quarantine_time", "in_quarantine", "time_in_quarantine", "will_vax",
+                "slowdown", "speedup", "risk")
+
+
+def world_size(num_agents):
+    """World with the aspect ratio of the screen and the agent density of the default simulation."""
+    scale = math.sqrt(num_agents / defaults.no_agents)
+    return defaults.SCREEN_WIDTH * scale, defaults.SCREEN_HEIGHT * scale
+
+
+class ArrayPopulation:
+    """Structure-of-arrays version of Simulation for large, headless populations.
+
+    Every per-agent attribute of Agent lives in one contiguous NumPy array and each phase of the tick
+    runs as a vectorized operation over the whole population. Dead agents keep their slot with state
+    DEAD, so indices stay stable for the lifetime of the population.
+
+    halo, when set, marks rows that are copies of agents owned elsewhere (see tiling.py): they move and
+    act as neighbours, but are never infected, released or resolved here and are left out of counts().
+
+    With an EventLog attached as events, every infection, recovery, death and quarantine move is
+    logged with the agent's row as its id.
+
+    agents, when given, is a dict of per-agent arrays drawn elsewhere (see demographics.py) that is
+    used as it is instead of allocate(); it carries its own initial infections, and num_agents and
+    num_infected are ignored.
+    """
+
+    def __init__(self, num_agents=defaults.no_agents, num_infected=defaults.no_infected,
+                 width=defaults.SCREEN_WIDTH, height=defaults.SCREEN_HEIGHT, seed=None, config=None,
+                 sample_every=1, stats_path=None, profiler=None, dt=None, events=None, agents=None):
+        self.config = config or SimulationConfig()
+        self.counters = Counters()
+        self.rng = np.random.default_rng(seed)
+        self.clock = SimulationClock(1 / defaults.FPS, dt)
+        self.width = width
+        self.height = height
+
+        # One quarantine zone: the first of Simulation's default zones for this world, with its capacity
+        x, y, zone_width, zone_height, self.quarantine_capacity = defaults.default_zone_layout(width, height)[0]
+        self.quarantine_rect = (x, y, zone_width, zone_height)
+        self.avoidance_radius = defaults.quarantine_avoidance_radius
+        self.avoidance_strength = defaults.quarantine_avoidance_strength
+
+        if agents is None:
+            self.allocate(num_agents)
+            seeded = self.rng.integers(0, num_agents, num_infected)
+            self.state[seeded] = INFECTED
+        else:
+            for name, values in agents.items():
+                setattr(self, name, values)
+            seeded = np.flatnonzero(self.state == INFECTED)
+            num_infected = len(seeded)
+        self.counters.infection_rate += num_infected
+        self.recorder = StatsRecorder(sample_every, spill_path=stats_path)
+        self.tick = 0
+        self.events = events
+        if events is not None:
+            seeded = np.unique(seeded)
+            events.log_many(0, INFECTION, seeded, positions=self.position[seeded])
+
+        # Clusters found by the last handle_grouping pass: the clustered agents, their cluster labels,
+        # and the size and centroid of every cluster (including single agents, which are not groups)
+        self.grouped = np.zeros(0, dtype=np.intp)
+        self.group_labels = np.zeros(0, dtype=np.intp)
+        self.group_sizes = np.zeros(0, dtype=np.intp)
+        self.group_centers = np.zeros((0, 2))
+        self.halo = None
+        self.profiler = profiler
+
+    def allocate(self, n):
+        """Draw the initial per-agent arrays, mirroring the random draws in Agent.__init__."""
+        rng = self.rng
+
+        self.position = np.column_stack((rng.uniform(0, self.width, n), rng.uniform(0, self.height, n)))
+        velocity = rng.uniform(-1, 1, (n, 2))
+        self.velocity = velocity / np.maximum(np.hypot(velocity[:, 0], velocity[:, 1]), 1e-12)[:, None]
+        self.speed = np.ones(n)
+
+        self.state = np.full(n, SUSCEPTIBLE, dtype=np.int8)
+        # Durations and timers are in simulated seconds
+        self.infection_timer = np.zeros(n, dtype=np.float32)
+        self.recovery_duration = rng.uniform(5, 10, n).astype(np.float32)
+        self.proximity_duration = np.zeros(n, dtype=np.float32)
+        self.quarantine_time = rng.uniform(10, 30, n).astype(np.float32)
+        self.in_quarantine = np.zeros(n, dtype=bool)
+        self.time_in_quarantine = np.zeros(n, dtype=np.float32)
+        self.will_vax = rng.random(n) < self.config.vaccination_rate
+        self.slowdown = np.zeros(n, dtype=bool)
+        self.speedup = np.zeros(n, dtype=bool)
+        # Chance of dying of an infection relative to 1 - config.recovery_probability
+        self.risk = np.ones(n, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.state)
+
+    def owned(self, mask):
+        """mask restricted to the rows this population updates, which is all of them without a halo."""
+        return mask if self.halo is None else mask & ~self.halo
+
+    @property
+    def nbytes(self):
+        """Memory held by the per-agent arrays."""
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+
+    @property
+    def quarantine_center(self):
+        x, y, width, height = self.quarantine_rect
+        return np.array([x + width // 2, y + height // 2], dtype=float)
+
+    # Phases of one tick, in the order step() runs them. Simulation.PHASES covers update_positions and repel
+    # with update_agents, and changes speeds as agents change state rather than in passes after handle_death
+    PHASES = ("update_positions", "repel", "handle_quarantine", "handle_infections", "handle_grouping",
+              "handle_death", "slow_down_infected_agents", "speed_up_recovered_agents", "track_history")
+
+    def step(self, n=1):
+        """Advance the population by n ticks of dt seconds, timing each phase if a profiler is attached."""
+        phases = [(phase, getattr(self, phase)) for phase in self.PHASES]
+        for _ in range(n):
+            if self.profiler is None:
+                for _, method in phases:
+                    method()
+            else:
+                for phase, method in phases:
+                    self.profiler.call(phase, method)
+                self.profiler.end_tick()
+            self.tick += 1
+            self.clock.advance()
+
+    def set_dt(self, dt):
+        """Switch to ticks of dt simulated seconds; the timers are in seconds, so they simply carry on."""
+        self.clock.dt = dt
+
+    def fast_forward(self, seconds, dt=COARSE_DT):
+        """Advance by seconds of simulated time in coarse ticks of dt, then go back to the current dt."""
+        fine = self.clock.dt
+        self.set_dt(dt)
+        self.step(self.clock.steps(seconds))
+        self.set_dt(fine)
+
+    def run_steps(self, n):
+        self.step(n)
+        return self.stats
+
+    @property
+    def stats(self):
+        return self.recorder.stats
+
+    def save_checkpoint(self, path):
+        """Write every per-agent array plus counters, config, RNG and stats to path, one raw block per array."""
+        arrays = {name: value for name, value in vars(self).items() if isinstance(value, np.ndarray)}
+        recorder_meta, arrays["stats"] = recorder_snapshot(self.recorder)
+        meta = {
+            "tick": self.tick,
+            "clock": self.clock.snapshot(),
+            "config": vars(self.config),
+            "counters": vars(self.counters),
+            "rng": self.rng.bit_generator.state,
+            "recorder": recorder_meta,
+            "world": [self.width, self.height],
+            "quarantine": {"rect": list(self.quarantine_rect), "capacity": self.quarantine_capacity,
+                           "avoidance_radius": self.avoidance_radius, "avoidance_strength": self.avoidance_strength},
+        }
+        write_snapshot(path, meta, arrays)
+
+    def load_checkpoint(self, path, mmap=True, stats_path=None):
+        """Replace the population with a checkpoint written by save_checkpoint(); running on from it
+        reproduces the original run exactly."""
+        meta, arrays = read_snapshot(path, mmap)
+
+        self.config = SimulationConfig(**meta["config"])
+        self.counters = Counters()
+        vars(self.counters).update(meta["counters"])
+        self.rng = np.random.default_rng()
+        self.rng.bit_generator.state = meta["rng"]
+        self.tick = meta["tick"]
+        self.clock = SimulationClock(**meta["clock"])
+        self.width, self.height = meta["world"]
+        self.quarantine_rect = tuple(meta["quarantine"]["rect"])
+        self.quarantine_capacity = meta["quarantine"]["capacity"]
+        self.avoidance_radius = meta["quarantine"]["avoidance_radius"]
+        self.avoidance_strength = meta["quarantine"]["avoidance_strength"]
+
+        self.recorder = restore_recorder(meta["recorder"], arrays.pop("stats"), stats_path)
+        # The phases update the arrays in place, so memory-mapped blocks are copied out of the file
+        for name, value in arrays.items():
+            setattr(self, name, np.array(value))
+
+    @classmethod
+    def from_checkpoint(cls, path, mmap=True, stats_path=None, profiler=None, events=None):
+        population = cls.__new__(cls)
+        population.profiler = profiler
+        population.events = events
+        population.halo = None
+        population.load_checkpoint(path, mmap, stats_path)
+        return population
+
+    def update_positions(self):
+        """Move every free agent along its velocity and bounce it off the world edges."""
+        moving = ~self.in_quarantine & (self.state != DEAD)
+        self.position += self.velocity * np.where(moving, self.speed * self.clock.frames, 0.0)[:, None]
+
+        x, y = self.position[:, 0], self.position[:, 1]
+        self.velocity[moving & ((x < 0) | (x > self.width)), 0] *= -1
+        self.velocity[moving & ((y < 0) | (y > self.height)), 1] *= -1
+
+        np.clip(x, 0, self.width, out=x)
+        np.clip(y, 0, self.height, out=y)
+
+    def repel(self):
+        """Steer agents away from every neighbour closer than repel_radius.
+
+        Like the other steering nudges, the push covers every frame of the tick, so coarse ticks steer
+        about as far per simulated second as fine ones.
+        """
+        alive = np.flatnonzero(self.state != DEAD)
+        points = self.position[alive]
+        radius = self.config.repel_radius
+        i, j, distance = grid_pairs(points, points, radius, same=True, strict=True)
+        apart = distance > 0
+        i, j, distance = i[apart], j[apart], distance[apart]
+        if len(i) == 0:
+            return
+
+        # Each pair comes once and pushes both agents, in opposite directions
+        direction = (points[i] - points[j]) / distance[:, None]
+        ends = np.concatenate((i, j))
+        push = np.column_stack((
+            np.bincount(ends, weights=np.concatenate((direction[:, 0], -direction[:, 0])), minlength=len(alive)),
+            np.bincount(ends, weights=np.concatenate((direction[:, 1], -direction[:, 1])), minlength=len(alive)),
+        ))
+        pushed = np.bincount(ends, minlength=len(alive)) > 0
+
+        targets = alive[pushed]
+        velocity = self.velocity[targets] + push[pushed] * 0.1 * self.clock.frames
+        self.velocity[targets] = velocity / np.maximum(np.hypot(velocity[:, 0], velocity[:, 1]), 1e-12)[:, None]
+
+    def handle_quarantine(self):
+        """Release agents whose quarantine time is up and steer everyone else clear of the zone."""
+        quarantined = self.owned(self.in_quarantine & (self.state != DEAD))
+        due = quarantined & (self.time_in_quarantine >= self.quarantine_time)
+        self.time_in_quarantine[quarantined & ~due] += self.clock.dt
+
+        released = np.flatnonzero(due)
+        if len(released):
+            succes = self.rng.random(len(released)) < self.config.vaccination_succes_probability
+            counters = self.counters
+            counters.successful_vax_rate += int(succes.sum())
+            counters.recovery_rate += int(succes.sum())
+            counters.failed_vax_rate += int((~succes).sum())
+
+            if self.events is not None:
+                self.events.log_many(self.tick, VACCINATED, released[succes], positions=self.position[released[succes]])
+                self.events.log_many(self.tick, VACCINATION_FAILED, released[~succes],
+                                     positions=self.position[released[~succes]])
+            self.state[released] = np.where(succes, RECOVERED, SUSCEPTIBLE)
+            self.in_quarantine[released] = False
+            self.will_vax[released] = False
+            self.position[released, 1] = self.quarantine_rect[1]
+
+        # Only susceptible, recovered or anti-vaxxer agents are pushed away
+        affected = (self.state != DEAD) & ((self.state != INFECTED) | ~self.will_vax)
+        offset = self.position - self.quarantine_center
+        distance = np.hypot(offset[:, 0], offset[:, 1])
+        steer = np.flatnonzero(affected & (distance <= self.avoidance_radius) & (distance > 0))
+        if len(steer):
+            self.velocity[steer] += offset[steer] / distance[steer, None] * self.avoidance_strength * self.clock.frames
+            self.clamp_velocity(steer)
+
+    def handle_infections(self):
+        """Roll infections for every susceptible within infection_radius of at least one infected agent.
+
+        Exposure accumulates while a susceptible stays in range of any infected agent and is reset once
+        it is out of range of all of them. Hazards from several infected neighbours combine as
+        independent chances, and each chance per frame compounds over the frames a tick covers.
+        """
+        clock = self.clock
+        infected = np.flatnonzero(self.state == INFECTED)
+        susceptible = np.flatnonzero(self.owned(self.state == SUSCEPTIBLE))
+        source, target, distance = grid_pairs(
+            self.position[infected], self.position[susceptible], self.config.infection_radius)
+
+        exposed = np.bincount(target, minlength=len(susceptible)) > 0
+        self.proximity_duration[susceptible[~exposed]] = 0
+        self.proximity_duration[susceptible[exposed]] += clock.dt
+        if len(target) == 0:
+            return
+
+        # Proximity factor: closer agents have higher chance of infection
+        proximity_factor = 1 - distance / self.config.infection_radius
+        probability = np.minimum(MAX_INFECTION_CHANCE, self.config.infection_probability
+                                 + proximity_factor * self.proximity_duration[susceptible[target]] / clock.frame)
+        escape = np.bincount(target, weights=np.log1p(-probability), minlength=len(susceptible)) * clock.frames
+
+        candidates = np.flatnonzero(exposed)
+        hit = self.rng.random(len(candidates)) < 1 - np.exp(escape[candidates])
+        newly_infected = susceptible[candidates[hit]]
+        if self.events is not None:
+            self.log_infections(newly_infected, candidates[hit], infected[source], target, -np.log1p(-probability))
+
+        self.state[newly_infected] = INFECTED
+        self.proximity_duration[newly_infected] = 0
+        self.counters.infection_rate += len(newly_infected)
+
+    def log_infections(self, agents, hits, sources, target, hazard):
+        """Log the infections of agents, the susceptibles numbered hits (ascending) in the contact pairs
+        (sources, target), each credited to one of its infected neighbours in proportion to their share
+        of its hazard."""
+        # Contact pairs of the infected susceptibles grouped by susceptible, and a draw into each group's total
+        pairs = np.flatnonzero(np.isin(target, hits))
+        pairs = pairs[np.argsort(target[pairs], kind="stable")]
+        cumulative = np.cumsum(hazard[pairs])
+        starts = np.searchsorted(target[pairs], hits, side="left")
+        ends = np.searchsorted(target[pairs], hits, side="right") - 1
+        before = np.where(starts > 0, cumulative[np.maximum(starts - 1, 0)], 0.0)
+        draw = before + self.events.rng.random(len(hits)) * (cumulative[ends] - before)
+        chosen = np.clip(np.searchsorted(cumulative, draw, side="right"), starts, ends)
+        self.events.log_many(self.tick, INFECTION, agents, sources[pairs[chosen]], self.position[agents])
+
+    @property
+    def groups(self):
+        """Groups of the last handle_grouping pass as Group objects holding agent indices."""
+        order = np.argsort(self.group_labels, kind="stable")
+        members = np.split(self.grouped[order], np.cumsum(self.group_sizes)[:-1])
+        return [Group(group, center) for group, center in zip(members, self.group_centers) if len(group) > 1]
+
+    def handle_grouping(self):
+        """Cluster infected pro-vax agents and redirect every group of two or more towards the quarantine zone.
+
+        While the zone is full the groups keep roaming, and agents arriving once it fills up are turned away.
+        """
+        candidates = np.flatnonzero((self.state == INFECTED) & self.will_vax)
+        labels, sizes, centers = cluster(self.position[candidates], self.config.grouping_radius)
+        self.grouped, self.group_labels, self.group_sizes, self.group_centers = candidates, labels, sizes, centers
+
+        room = len(candidates)
+        if self.quarantine_capacity is not None:
+            # Under tiling each tile only sees the members it owns, so a zone on a tile edge can overfill
+            room = self.quarantine_capacity - int(np.count_nonzero(self.owned(self.in_quarantine)))
+        group = candidates[sizes[labels] > 1]
+        if len(group) == 0 or room <= 0:
+            return
+
+        offset = self.quarantine_center - self.position[group]
+        distance = np.hypot(offset[:, 0], offset[:, 1])
+        moving = distance > 0
+        self.velocity[group[moving]] += offset[moving] / distance[moving, None] * 0.1 * self.clock.frames
+        self.clamp_velocity(group)
+
+        # Agents that reached the zone are held there until released, in agent order while there is room
+        arrived = group[distance < self.config.infection_radius]
+        entering = arrived[~self.in_quarantine[arrived]][:room]
+        if self.events is not None:
+            self.events.log_many(self.tick, QUARANTINE_ENTRY, entering, positions=self.position[entering])
+        self.in_quarantine[entering] = True
+
+    def handle_death(self):
+        """Advance infection timers and resolve every infection that has run its course."""
+        infected = np.flatnonzero(self.owned(self.state == INFECTED))
+        self.infection_timer[infected] += self.clock.dt
+
+        due = infected[self.infection_timer[infected] >= self.recovery_duration[infected]]
+        if len(due) == 0:
+            return
+
+        recovered = self.rng.random(len(due)) < 1 - (1 - self.config.recovery_probability) * self.risk[due]
+        if self.events is not None:
+            self.events.log_many(self.tick, RECOVERY, due[recovered], positions=self.position[due[recovered]])
+            self.events.log_many(self.tick, DEATH, due[~recovered], positions=self.position[due[~recovered]])
+        self.state[due[recovered]] = SUSCEPTIBLE
+        self.counters.recovery_rate += int(recovered.sum())
+
+        dead = due[~recovered]
+        self.state[dead] = DEAD
+        self.in_quarantine[dead] = False
+        self.counters.death_count += len(dead)
+
+    def slow_down_infected_agents(self, slowdown_factor=None):
+        if slowdown_factor is None:
+            slowdown_factor = self.config.slowdown
+        agents = (self.state == INFECTED) & ~self.slowdown
+        self.speed[agents] *= slowdown_factor
+        self.slowdown |= agents
+
+    def speed_up_recovered_agents(self, speedup_factor=None):
+        if speedup_factor is None:
+            speedup_factor = self.config.speedup
+        agents = (self.state == RECOVERED) & ~self.speedup
+        self.speed[agents] *= speedup_factor
+        self.speedup |= agents
+
+    def clamp_velocity(self, agents):
+        """Normalize the velocities of agents that got faster than unit speed."""
+        velocity = self.velocity[agents]
+        length = np.hypot(velocity[:, 0], velocity[:, 1])
+        fast = length > 1
+        self.velocity[agents[fast]] = velocity[fast] / length[fast, None]
+
+    def counts(self):
+        """Current (susceptible, infected, recovered) head counts."""
+        counts = np.bincount(self.state if self.halo is None else self.state[~self.halo], minlength=4)
+        return int(counts[SUSCEPTIBLE]), int(counts[INFECTED]), int(counts[RECOVERED])
+
+    def track_history(self):
+        self.recorder.record(self.counters, self.counts())
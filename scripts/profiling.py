@@ -0,0 +1,85 @@
+import json
+import time
+from collections import deque
+
+
+class PhaseProfiler:
+    """Per-phase wall-clock timings of a simulation, kept over a rolling window of ticks.
+
+    Attach one to a Simulation or ArrayPopulation (profiler=...) and every phase of every tick is timed;
+    with no profiler attached the tick loop does not time anything. Each finished tick can also be
+    appended to a log file: CSV if log_path ends in .csv, one JSON object per line otherwise.
+    """
+
+    def __init__(self, window=240, log_path=None):
+        self.window = window
+        self.samples = {}
+        self.totals = {}
+        self.calls = {}
+        self.current = {}
+        self.tick_times = deque(maxlen=window)
+        self.ticks = 0
+
+        self.log_path = log_path
+        self.log = open(log_path, "w") if log_path else None
+        self.log_columns = None
+
+    def call(self, phase, method):
+        """Run method, recording its duration under phase."""
+        start = time.perf_counter()
+        method()
+        self.record(phase, time.perf_counter() - start)
+
+    def record(self, phase, seconds):
+        if phase not in self.samples:
+            self.samples[phase] = deque(maxlen=self.window)
+            self.totals[phase] = 0.0
+            self.calls[phase] = 0
+        self.samples[phase].append(seconds)
+        self.totals[phase] += seconds
+        self.calls[phase] += 1
+        self.current[phase] = self.current.get(phase, 0.0) + seconds
+
+    def end_tick(self):
+        """Close the current tick: note its end time and write its phase timings to the log."""
+        self.tick_times.append(time.perf_counter())
+        if self.log is not None:
+            self.write_log_row()
+        self.current = {}
+        self.ticks += 1
+
+    def write_log_row(self):
+        row = {"tick": self.ticks}
+        row.update({phase: round(seconds * 1000, 4) for phase, seconds in self.current.items()})
+        if not self.log_path.endswith(".csv"):
+            self.log.write(json.dumps(row) + "\n")
+            return
+
+        if self.log_columns is None:
+            self.log_columns = list(row)
+            self.log.write(",".join(self.log_columns) + "\n")
+        self.log.write(",".join(str(row.get(column, "")) for column in self.log_columns) + "\n")
+
+    def ticks_per_second(self):
+        """Tick rate over the rolling window."""
+        if len(self.tick_times) < 2:
+            return 0.0
+        return (len(self.tick_times) - 1) / (self.tick_times[-1] - self.tick_times[0])
+
+    def summary(self):
+        """Rolling statistics per phase, in milliseconds."""
+        return {
+            phase: {
+                "mean_ms": 1000 * sum(samples) / len(samples),
+                "max_ms": 1000 * max(samples),
+                "last_ms": 1000 * samples[-1],
+                "total_ms": 1000 * self.totals[phase],
+                "calls": self.calls[phase],
+            }
+            for phase, samples in self.samples.items() if samples
+        }
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+
+# Layout of the stats rows, as returned by StatsRecorder.stats
+STAT_FIELDS = ("susceptible", "infected", "recovered", "death_count", "failed_vax_rate",
+               "successful_vax_rate", "infection_rate", "recovery_rate")
+
+# On-disk and in-memory row layout: the tick a row was sampled at, then the stats
+COLUMNS = ("tick",) + STAT_FIELDS
+
+
+class StatsRecorder:
+    """Time series of simulation stats in a preallocated, growable int64 array.
+
+    A row is recorded every sample_every ticks. With spill_path set, the buffer holds at most
+    chunk_size rows; full chunks are appended to a raw binary file and the buffer is reused, so memory
+    stays flat however long the run is. S/I/R head counts are kept up to date through transition()
+    instead of being recounted from the agents every tick.
+    """
+
+    def __init__(self, sample_every=1, capacity=1024, spill_path=None, chunk_size=65536):
+        self.sample_every = sample_every
+        self.spill_path = spill_path
+        self.rows = np.zeros((chunk_size if spill_path else capacity, len(COLUMNS)), dtype=np.int64)
+        self.size = 0
+        self.spilled = 0
+        self.tick = 0
+        self.counts = {"S": 0, "I": 0, "R": 0}
+
+        if spill_path:
+            open(spill_path, "wb").close()
+
+    def __len__(self):
+        return self.spilled + self.size
+
+    def count(self, agents):
+        """Reset the running head counts from a full scan of the agents."""
+        self.counts = {"S": 0, "I": 0, "R": 0}
+        for agent in agents:
+            self.counts[agent.state] += 1
+
+    def transition(self, old, new):
+        """Move one agent between states; None stands for an agent entering or leaving the population."""
+        if old is not None:
+            self.counts[old] -= 1
+        if new is not None:
+            self.counts[new] += 1
+
+    def record(self, counters, counts=None):
+        """Sample one tick of stats, using counts=(S, I, R) if given or the running head counts otherwise."""
+        if self.tick % self.sample_every == 0:
+            susceptible, infected, recovered = counts or (self.counts["S"], self.counts["I"], self.counts["R"])
+            self.append((self.tick, susceptible, infected, recovered, counters.death_count, counters.failed_vax_rate,
+                         counters.successful_vax_rate, counters.infection_rate, counters.recovery_rate))
+        self.tick += 1
+
+    def append(self, row):
+        if self.size == len(self.rows):
+            if self.spill_path:
+                self.flush()
+            else:
+                grown = np.zeros((2 * len(self.rows), len(COLUMNS)), dtype=np.int64)
+                grown[:self.size] = self.rows
+                self.rows = grown
+
+        self.rows[self.size] = row
+        self.size += 1
+
+    def flush(self):
+        """Append the buffered rows to the spill file and empty the buffer."""
+        if self.spill_path and self.size:
+            with open(self.spill_path, "ab") as spill:
+                self.rows[:self.size].tofile(spill)
+            self.spilled += self.size
+            self.size = 0
+
+    def table(self):
+        """Every recorded row as a (rows, len(COLUMNS)) array, memory-mapped when spilling."""
+        if not self.spill_path:
+            return self.rows[:self.size]
+        self.flush()
+        return load_recording(self.spill_path)
+
+    @property
+    def ticks(self):
+        return self.table()[:, 0]
+
+    @property
+    def stats(self):
+        """The stats columns, laid out like the tuples of STAT_FIELDS."""
+        return self.table()[:, 1:]
+
+
+def load_recording(path):
+    """Memory-map a spill file written by StatsRecorder."""
+    if os.path.getsize(path) == 0:
+        return np.zeros((0, len(COLUMNS)), dtype=np.int64)
+    return np.memmap(path, dtype=np.int64, mode="r").reshape(-1, len(COLUMNS))
@@ -0,0 +1,36 @@
+import heapq
+
+
+class EventScheduler:
+    """Priority queue of per-agent events keyed on the tick they come due.
+
+    schedule() returns an event id the caller keeps on the agent; an event whose id no longer matches
+    is stale (the agent's state changed first) and is simply skipped by the caller, so nothing ever
+    has to be removed from the middle of the heap. Events due on the same tick pop in schedule order.
+    """
+
+    def __init__(self):
+        self.queue = []
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def schedule(self, tick, agent):
+        event = self.next_id
+        self.next_id += 1
+        heapq.heappush(self.queue, (tick, event, agent))
+        return event
+
+    def restore(self, entries, next_id):
+        """Reload (tick, event, agent) entries saved from another scheduler; ids continue from next_id."""
+        self.queue = list(entries)
+        heapq.heapify(self.queue)
+        self.next_id = next_id
+
+    def pop_due(self, tick):
+        """Yield (event, agent) for every event due at or before tick."""
+        queue = self.queue
+        while queue and queue[0][0] <= tick:
+            _, event, agent = heapq.heappop(queue)
+            yield event, agent
@@ -0,0 +1,128 @@
+import numpy as np
+
+
+class SpatialGrid:
+    """Uniform grid over agent positions, used to answer radius queries without scanning every agent."""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.agents = []
+
+    def cell_of(self, position):
+        return int(position.x // self.cell_size), int(position.y // self.cell_size)
+
+    def build(self, agents):
+        """Bucket every agent by the cell its position falls in."""
+        self.cells = {}
+        self.agents = agents
+        for index, agent in enumerate(agents):
+            self.cells.setdefault(self.cell_of(agent.position), []).append(index)
+        return self
+
+    def query(self, position, radius):
+        """Return the agents in every cell touched by the square around position, in list order.
+
+        The result is a superset of the agents within radius, so callers still do their own
+        distance check; keeping list order means they see agents in the same order as a full scan.
+        """
+        size = self.cell_size
+        min_x, max_x = int((position.x - radius) // size), int((position.x + radius) // size)
+        min_y, max_y = int((position.y - radius) // size), int((position.y + radius) // size)
+
+        indices = []
+        for cell_x in range(min_x, max_x + 1):
+            for cell_y in range(min_y, max_y + 1):
+                indices.extend(self.cells.get((cell_x, cell_y), ()))
+        indices.sort()
+
+        return [self.agents[index] for index in indices]
+
+
+class RegionIndex:
+    """Static circular regions bucketed by the grid cells they reach into.
+
+    The reverse of SpatialGrid: the regions never move, so the buckets are built once and every
+    agent looks up the handful of regions around it instead of every region scanning every agent.
+    """
+
+    def __init__(self, regions, cell_size):
+        """regions is a sequence of (item, center, radius); lookups return items in that order."""
+        self.cell_size = cell_size
+        self.cells = {}
+        for item, center, radius in regions:
+            min_x, max_x = int((center.x - radius) // cell_size), int((center.x + radius) // cell_size)
+            min_y, max_y = int((center.y - radius) // cell_size), int((center.y + radius) // cell_size)
+            for cell_x in range(min_x, max_x + 1):
+                for cell_y in range(min_y, max_y + 1):
+                    self.cells.setdefault((cell_x, cell_y), []).append(item)
+
+    def lookup(self, position):
+        """Items whose region may contain position; callers still check the exact distance."""
+        return self.cells.get((int(position.x // self.cell_size), int(position.y // self.cell_size)), ())
+
+
+def grid_pairs(points_a, points_b, radius, same=False, strict=False):
+    """Vectorized radius query between two point arrays of shape (n, 2).
+
+    Points are bucketed on a grid with cell size radius, so each point of points_a is only compared
+    with points_b in its own and the eight surrounding cells. Returns index arrays (i, j) into
+    points_a / points_b and the distances between them, for every pair within radius (closer than
+    radius if strict). With same=True the two arrays are the same set: self-pairs are dropped and
+    each unordered pair is returned once, in either order.
+    """
+    empty = np.empty(0, dtype=np.intp)
+    if len(points_a) == 0 or len(points_b) == 0:
+        return empty, empty, np.empty(0)
+
+    cells_a = np.floor(points_a / radius).astype(np.int64)
+    cells_b = cells_a if same else np.floor(points_b / radius).astype(np.int64)
+    # Column by column: min(axis=0) over the interleaved (n, 2) rows is many times slower
+    origin = np.array([min(cells_a[:, k].min(), cells_b[:, k].min()) for k in (0, 1)]) - 1
+    cells_a -= origin
+    if not same:
+        cells_b -= origin
+    stride = max(cells_a[:, 1].max(), cells_b[:, 1].max()) + 2
+
+    # Query in key order too: sorted needles make searchsorted several times faster
+    keys_a = cells_a[:, 0] * stride + cells_a[:, 1]
+    order_a = np.argsort(keys_a)
+    sorted_a = keys_a[order_a]
+
+    # Each query is a range of sorted_b: the three cells of a grid column are consecutive keys
+    if same:
+        order_b, sorted_b = order_a, sorted_a
+        # Every unordered cell pair once: the points after this one in its own cell and the cell
+        # above it (one range), then the three cells of the next column
+        ranges = [
+            (np.arange(1, len(sorted_a) + 1), np.searchsorted(sorted_b, sorted_a + 1, side="right")),
+            (np.searchsorted(sorted_b, sorted_a + stride - 1, side="left"),
+             np.searchsorted(sorted_b, sorted_a + stride + 1, side="right")),
+        ]
+    else:
+        keys_b = cells_b[:, 0] * stride + cells_b[:, 1]
+        order_b = np.argsort(keys_b)
+        sorted_b = keys_b[order_b]
+        ranges = [(np.searchsorted(sorted_b, column - 1, side="left"),
+                   np.searchsorted(sorted_b, column + 1, side="right"))
+                  for column in (sorted_a + dx * stride for dx in (-1, 0, 1))]
+
+    pairs_a, pairs_b = [], []
+    for start, stop in ranges:
+        counts = stop - start
+        total = counts.sum()
+        if total == 0:
+            continue
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        pairs_a.append(np.repeat(order_a, counts))
+        pairs_b.append(order_b[np.repeat(start, counts) + np.arange(total) - first])
+
+    if not pairs_a:
+        return empty, empty, np.empty(0)
+
+    i = np.concatenate(pairs_a)
+    j = np.concatenate(pairs_b)
+    distance = np.hypot(points_a[i, 0] - points_b[j, 0], points_a[i, 1] - points_b[j, 1])
+
+    keep = distance < radius if strict else distance <= radius
+    return i[keep], j[keep], distance[keep]
@@ -0,0 +1,349 @@
+import math
+import multiprocessing
+import os
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import epidemic_sim as defaults
+from clock import SimulationClock
+from data import region_population
+from epidemic_sim import Counters, SimulationConfig
+from population import AGENT_ARRAYS, DEAD, INFECTED, RECOVERED, SUSCEPTIBLE, ArrayPopulation, world_size
+from recorder import STAT_FIELDS, StatsRecorder
+
+# Phases a tile worker runs on its own agents plus their halo; stats are reduced by the parent instead
+TILE_PHASES = tuple(phase for phase in ArrayPopulation.PHASES if phase != "track_history")
+# Drawn once in allocate() and never updated, so they are never written back to shared memory
+FIXED_ARRAYS = ("recovery_duration", "quarantine_time", "risk")
+# Ticks run per command sent to the workers; their per-tick stats rows are buffered in shared memory
+CHUNK_TICKS = 256
+
+
+def tile_grid(workers, width, height):
+    """(columns, rows) of workers tiles, with the tiles as close to square as the worker count allows."""
+    columns = min(range(1, workers + 1), key=lambda columns: (
+        workers % columns != 0, abs(math.log(width / columns) - math.log(height / (workers // columns)))))
+    return columns, workers // columns
+
+
+def create_shared(arrays):
+    """Copy a dict of arrays into new shared memory blocks.
+
+    Returns the blocks, views of the arrays onto them and a picklable layout for attach_shared().
+    """
+    blocks, views, layout = {}, {}, {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        blocks[name], views[name] = block, view
+        layout[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, views, layout
+
+
+def attach_shared(layout):
+    """Attach to the blocks of a create_shared() layout from another process."""
+    blocks, views = {}, {}
+    for name, (block_name, shape, dtype) in layout.items():
+        blocks[name] = shared_memory.SharedMemory(name=block_name)
+        views[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+    return blocks, views
+
+
+class TileWorker:
+    """Steps the agents inside one tile of a TiledPopulation, in its own process.
+
+    Every tick the worker copies the agents it owns, plus the halo of agents owned by other tiles that
+    could come within interaction range of them, into a local ArrayPopulation, runs the phases there and
+    writes only its own agents back. Agents that ended the tick outside the tile are handed over through
+    the mailboxes, and every agent near an inner tile edge is listed for the neighbouring tiles' halos.
+    Workers exchange agent indices only; the agent data itself never leaves shared memory.
+
+    The outbox and border mailboxes hold one slot per agent in all, shared between the tiles: both lists
+    of a tile only ever hold agents it owns, so each tile writes from the start of its stretch, after the
+    slots of the agents owned by the tiles before it.
+    """
+
+    def __init__(self, tile, spec, views, barrier):
+        self.tile = tile
+        self.views = views
+        self.barrier = barrier
+        self.columns, self.rows = spec["tiles"]
+        self.width, self.height = spec["world"]
+        self.tile_width, self.tile_height = self.width / self.columns, self.height / self.rows
+        self.margin = spec["margin"]
+
+        column, row = tile % self.columns, tile // self.columns
+        self.rect = (column * self.tile_width, row * self.tile_height,
+                     (column + 1) * self.tile_width, (row + 1) * self.tile_height)
+
+        local = ArrayPopulation.__new__(ArrayPopulation)
+        local.config = spec["config"]
+        local.counters = Counters()
+        vars(local.counters).update(spec["counters"][tile])
+        local.rng = np.random.default_rng(spec["seeds"][tile])
+        local.clock = SimulationClock(1 / defaults.FPS, spec["dt"])
+        local.width, local.height = self.width, self.height
+        (local.quarantine_rect, local.quarantine_capacity, local.avoidance_radius,
+         local.avoidance_strength) = spec["quarantine"]
+        local.profiler = None
+        local.events = None
+        self.local = local
+
+        position = views["position"]
+        alive = np.flatnonzero(views["state"] != DEAD)
+        self.agents = alive[self.tile_of(position[alive]) == tile]
+        views["owned_counts"][tile] = len(self.agents)
+        self.barrier.wait()
+        self.publish_border()
+
+    def tile_of(self, position):
+        column = np.minimum((position[:, 0] / self.tile_width).astype(np.intp), self.columns - 1)
+        row = np.minimum((position[:, 1] / self.tile_height).astype(np.intp), self.rows - 1)
+        return row * self.columns + column
+
+    def mailbox_start(self):
+        """First slot of this tile's stretch of the mailboxes, given everyone's owned agents."""
+        return int(self.views["owned_counts"][:self.tile].sum())
+
+    def read_mail(self, box, column):
+        """Agent indices the other tiles listed in a mailbox."""
+        starts, counts = self.views["mail_starts"][:, column], self.views["mail_counts"][:, column]
+        listed = [self.views[box][starts[tile]:starts[tile] + counts[tile]] for tile in range(len(counts))
+                  if tile != self.tile]
+        return np.concatenate(listed) if listed else np.zeros(0, dtype=np.int64)
+
+    def publish_border(self):
+        """List the owned agents within the halo margin of an inner edge of the tile."""
+        x, y = self.views["position"][self.agents].T
+        left, top, right, bottom = self.rect
+        near = (((x - left < self.margin) & (left > 0)) | ((right - x < self.margin) & (right < self.width))
+                | ((y - top < self.margin) & (top > 0)) | ((bottom - y < self.margin) & (bottom < self.height)))
+        border = self.agents[near]
+        start = self.mailbox_start()
+        self.views["border"][start:start + len(border)] = border
+        self.views["mail_starts"][self.tile, 1] = start
+        self.views["mail_counts"][self.tile, 1] = len(border)
+
+    def halo(self):
+        """Agents of the other tiles listed on their borders that lie within the margin of this tile."""
+        listed = self.read_mail("border", 1)
+        x, y = self.views["position"][listed].T
+        left, top, right, bottom = self.rect
+        inside = ((x > left - self.margin) & (x < right + self.margin)
+                  & (y > top - self.margin) & (y < bottom + self.margin))
+        return listed[inside]
+
+    def tick(self, stats_row):
+        views, local, agents = self.views, self.local, self.agents
+        rows = np.concatenate((agents, self.halo()))
+        for name in AGENT_ARRAYS:
+            setattr(local, name, views[name][rows])
+        local.halo = np.arange(len(rows)) >= len(agents)
+        # Nobody writes agent data until every tile has read its copy
+        self.barrier.wait()
+
+        for phase in TILE_PHASES:
+            getattr(local, phase)()
+        for name in AGENT_ARRAYS:
+            if name not in FIXED_ARRAYS:
+                views[name][agents] = getattr(local, name)[:len(agents)]
+        stats_row[:3] = local.counts()
+        stats_row[3:] = [getattr(local.counters, field) for field in STAT_FIELDS[3:]]
+
+        # Migration: agents that left the tile are mailed to whichever tile they are in now, and the dead
+        # are dropped by every tile, including ones that died on the way out
+        staying = self.tile_of(local.position[:len(agents)]) == self.tile
+        alive = local.state[:len(agents)] != DEAD
+        leaving = agents[~staying & alive]
+        start = self.mailbox_start()
+        views["outbox"][start:start + len(leaving)] = leaving
+        views["mail_starts"][self.tile, 0] = start
+        views["mail_counts"][self.tile, 0] = len(leaving)
+        kept = agents[staying & alive]
+        self.barrier.wait()
+
+        arriving = self.read_mail("outbox", 0)
+        arriving = arriving[self.tile_of(views["position"][arriving]) == self.tile]
+        self.agents = np.sort(np.concatenate((kept, arriving)))
+        # The border stretches follow the new ownership, so every tile has to have counted its agents first
+        views["owned_counts"][self.tile] = len(self.agents)
+        self.barrier.wait()
+        self.publish_border()
+        self.barrier.wait()
+
+
+def run_tile(tile, spec, layout, barrier, connection):
+    """Worker process: run the ticks asked for over connection until it sends None."""
+    blocks, views = attach_shared(layout)
+    try:
+        worker = TileWorker(tile, spec, views, barrier)
+        barrier.wait()
+        while True:
+            ticks = connection.recv()
+            if ticks is None:
+                break
+            for t in range(ticks):
+                worker.tick(views["tick_stats"][t, tile])
+            connection.send(None)
+    except Exception:
+        # Release the other workers from the barrier instead of leaving them waiting forever
+        barrier.abort()
+        connection.send(traceback.format_exc())
+    finally:
+        del views
+        for block in blocks.values():
+            block.close()
+
+
+class TiledPopulation:
+    """An ArrayPopulation world split into tiles, each stepped by its own worker process.
+
+    The world is sized independently of the screen (by default at the density of the windowed
+    simulation) and cut into a grid of tiles, one per worker. The per-agent arrays live in shared memory
+    and each worker updates the agents inside its tile, reading a halo of neighbours across the tile
+    edges so contacts, repulsion and grouping work as in one world; agents crossing an edge migrate to
+    the next tile. Per-tile head counts and counters are summed into the stats every tick.
+
+    Each tile draws from its own random stream and halo agents are read as they were at the start of
+    the tick, so runs match ArrayPopulation statistically rather than draw for draw.
+
+    agents takes pre-drawn per-agent arrays as ArrayPopulation does; only those in AGENT_ARRAYS are shared.
+    """
+
+    def __init__(self, num_agents=defaults.no_agents, num_infected=defaults.no_infected, width=None, height=None,
+                 workers=None, tiles=None, seed=None, config=None, sample_every=1, stats_path=None, dt=None,
+                 agents=None):
+        if agents is not None:
+            num_agents = len(agents["state"])
+        if width is None or height is None:
+            width, height = world_size(num_agents)
+        if tiles is None:
+            tiles = tile_grid(workers or os.cpu_count() or 1, width, height)
+        self.tiles = tiles
+        self.width, self.height = width, height
+        self.config = config or SimulationConfig()
+        self.counters = Counters()
+        self.recorder = StatsRecorder(sample_every, spill_path=stats_path)
+        self.tick = 0
+
+        count = tiles[0] * tiles[1]
+        seeds = np.random.SeedSequence(seed).spawn(count + 1)
+        population = ArrayPopulation(num_agents, num_infected, width, height, seed=seeds[0], config=self.config, dt=dt,
+                                     agents=agents)
+        num_infected = population.counters.infection_rate
+        self.clock = population.clock
+        self.quarantine_rect = population.quarantine_rect
+        quarantine = (population.quarantine_rect, population.quarantine_capacity, population.avoidance_radius,
+                      population.avoidance_strength)
+
+        # Farthest an agent can move in one tick, for an agent on either side of a tile edge
+        config = self.config
+        step = max(1, config.slowdown, config.speedup, config.slowdown * config.speedup) * self.clock.frames
+        margin = max(config.repel_radius, config.infection_radius, config.grouping_radius) + 2 * step
+
+        arrays = {name: getattr(population, name) for name in AGENT_ARRAYS}
+        # Mailboxes of agent indices, one slot per agent shared by all tiles (see TileWorker), with the
+        # start and length of every tile's outbox and border lists and the agents each tile owns
+        index = np.int32 if num_agents < 2**31 else np.int64
+        arrays["outbox"] = np.zeros(num_agents, dtype=index)
+        arrays["border"] = np.zeros(num_agents, dtype=index)
+        arrays["mail_starts"] = np.zeros((count, 2), dtype=np.int64)
+        arrays["mail_counts"] = np.zeros((count, 2), dtype=np.int64)
+        arrays["owned_counts"] = np.zeros(count, dtype=np.int64)
+        arrays["tick_stats"] = np.zeros((CHUNK_TICKS, count, len(STAT_FIELDS)), dtype=np.int64)
+        del population
+        self.blocks, self.views, layout = create_shared(arrays)
+        for name in AGENT_ARRAYS:
+            setattr(self, name, self.views[name])
+
+        # The initial infections are counted once, by the first tile
+        counters = [vars(Counters()) for _ in range(count)]
+        counters[0]["infection_rate"] = num_infected
+        spec = {
+            "tiles": tiles, "world": (width, height), "margin": margin, "config": self.config,
+            "counters": counters, "seeds": seeds[1:],
+            "quarantine": quarantine, "dt": self.clock.dt,
+        }
+
+        context = multiprocessing.get_context()
+        barrier = context.Barrier(count)
+        self.connections, self.processes = [], []
+        for tile in range(count):
+            parent, child = context.Pipe()
+            process = context.Process(target=run_tile, args=(tile, spec, layout, barrier, child), daemon=True)
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    @classmethod
+    def for_region(cls, selected_region, scale=1.0, infected_fraction=None, **kwargs):
+        """Population sized from a region's 2022 head count, times scale agents per inhabitant."""
+        inhabitants = region_population(selected_region)
+        if inhabitants is None:
+            raise ValueError(f"No population data for {selected_region}")
+        num_agents = max(1, round(inhabitants * scale))
+        if infected_fraction is None:
+            infected_fraction = defaults.no_infected / defaults.no_agents
+        return cls(num_agents, max(1, round(num_agents * infected_fraction)), **kwargs)
+
+    def __len__(self):
+        return len(self.state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def step(self, n=1):
+        """Advance every tile by n ticks, then reduce the per-tile stats of each tick."""
+        while n > 0:
+            ticks = min(n, CHUNK_TICKS)
+            for connection in self.connections:
+                connection.send(ticks)
+            errors = [reply for reply in (connection.recv() for connection in self.connections) if reply]
+            if errors:
+                self.close()
+                raise RuntimeError(f"Tile worker failed:\n{errors[0]}")
+
+            for row in self.views["tick_stats"][:ticks].sum(axis=1):
+                vars(self.counters).update(zip(STAT_FIELDS[3:], row[3:].tolist()))
+                self.recorder.record(self.counters, tuple(row[:3].tolist()))
+            self.tick += ticks
+            self.clock.advance(ticks)
+            n -= ticks
+
+    def run_steps(self, n):
+        self.step(n)
+        return self.stats
+
+    @property
+    def stats(self):
+        return self.recorder.stats
+
+    def counts(self):
+        """Current (susceptible, infected, recovered) head counts over all tiles."""
+        counts = np.bincount(self.state, minlength=4)
+        return int(counts[SUSCEPTIBLE]), int(counts[INFECTED]), int(counts[RECOVERED])
+
+    def close(self):
+        """Stop the workers and free the shared memory; the agent arrays are copied out first."""
+        if not self.processes:
+            return
+        for connection, process in zip(self.connections, self.processes):
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            process.join()
+        self.processes = []
+        for name in AGENT_ARRAYS:
+            setattr(self, name, np.array(self.views[name]))
+        self.views = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
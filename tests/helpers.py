@@ -0,0 +1,18 @@
+import numpy as np
+
+# Two zones that fill up and one without a limit, so runs hold full zones, queued groups and members
+ZONES = [(100, 100, 150, 100, 20), (1000, 100, 150, 100, 20), (550, 600, 200, 100, None)]
+
+
+def agent_state(simulation):
+    """Everything that tells two object simulations apart, as arrays."""
+    agents = simulation.agents
+    return {
+        "position": np.array([tuple(agent.position) for agent in agents]),
+        "velocity": np.array([tuple(agent.velocity) for agent in agents]),
+        "state": np.array([agent.state for agent in agents]),
+        "timers": np.array([(agent.infection_timer, agent.proximity_duration, agent.time_in_quarantine)
+                            for agent in agents]),
+        "flags": np.array([(agent.in_quarantine, agent.will_vax, agent.slowdown, agent.speedup) for agent in agents]),
+        "zones": np.array([len(zone.agents_in_quarantine) for zone in simulation.quarantine_zones]),
+    }
@@ -0,0 +1,42 @@
+import numpy as np
+
+from epidemic_sim import Simulation
+from helpers import ZONES, agent_state
+from population import ArrayPopulation
+
+
+def test_simulation_resumes_exactly(tmp_path):
+    path = str(tmp_path / "simulation.sim")
+    simulation = Simulation(200, 20, seed=0, quarantine_zones=ZONES)
+    simulation.step(900)
+    assert all(zone.agents_in_quarantine for zone in simulation.quarantine_zones)
+    assert len(simulation.recovery_checks) and len(simulation.releases)
+    assert simulation.counters.death_count > 0
+
+    simulation.save_checkpoint(path)
+    resumed = Simulation.from_checkpoint(path)
+    simulation.step(600)
+    resumed.step(600)
+
+    assert np.array_equal(simulation.stats, resumed.stats)
+    expected, actual = agent_state(simulation), agent_state(resumed)
+    for name in expected:
+        assert np.array_equal(expected[name], actual[name]), name
+
+
+def test_array_population_resumes_exactly(tmp_path):
+    path = str(tmp_path / "population.sim")
+    population = ArrayPopulation(2000, 50, seed=0)
+    population.step(900)
+    assert population.in_quarantine.any()
+
+    population.save_checkpoint(path)
+    resumed = ArrayPopulation.from_checkpoint(path)
+    population.step(600)
+    resumed.step(600)
+
+    assert np.array_equal(population.stats, resumed.stats)
+    arrays = {name for name, value in vars(population).items() if isinstance(value, np.ndarray)}
+    assert arrays == {name for name, value in vars(resumed).items() if isinstance(value, np.ndarray)}
+    for name in arrays:
+        assert np.array_equal(getattr(population, name), getattr(resumed, name)), name
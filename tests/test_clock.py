@@ -0,0 +1,75 @@
+import pytest
+
+from clock import COARSE_DT
+from epidemic_sim import Simulation
+from helpers import ZONES
+
+
+def due_times(simulation):
+    """Simulated time at the end of the tick each pending recovery check and release comes due, by agent uid.
+
+    Entries of agents that died or already moved on are stale and left out, as the phases skip them.
+    """
+    clock, tick = simulation.clock, simulation.tick
+    infected = {agent for agent in simulation.agents if agent.state == "I"}
+    quarantined = {agent for agent in simulation.agents if agent.in_quarantine}
+
+    def times(scheduler, pending, agents):
+        return {agent.uid: clock.time + (due - tick + 1) * clock.dt
+                for due, event, agent in scheduler.queue if agent in agents and getattr(agent, pending) == event}
+
+    return (times(simulation.recovery_checks, "pending_check", infected),
+            times(simulation.releases, "pending_release", quarantined))
+
+
+def assert_same_times(before, after, tolerance):
+    assert before.keys() == after.keys()
+    for uid, time in before.items():
+        assert after[uid] == pytest.approx(time, abs=tolerance)
+
+
+@pytest.fixture
+def simulation():
+    """A run with infections in progress and agents waiting in the zones."""
+    simulation = Simulation(200, 20, seed=0, quarantine_zones=ZONES)
+    simulation.step(900)
+    checks, releases = due_times(simulation)
+    assert checks and releases
+    return simulation
+
+
+@pytest.mark.parametrize("dt", [COARSE_DT, 3 / 144, 0.5 / 144])
+def test_set_dt_keeps_scheduled_events_at_the_same_time(simulation, dt):
+    checks, releases = due_times(simulation)
+    fine = simulation.clock.dt
+
+    simulation.set_dt(dt)
+    # Events round up to a tick boundary and a release comes the tick after its time is up, so they may
+    # move by up to two ticks of the longer length
+    tolerance = 2 * max(dt, fine) + 1e-9
+    new_checks, new_releases = due_times(simulation)
+    assert_same_times(checks, new_checks, tolerance)
+    assert_same_times(releases, new_releases, tolerance)
+
+    simulation.set_dt(fine)
+    new_checks, new_releases = due_times(simulation)
+    assert_same_times(checks, new_checks, tolerance)
+    assert_same_times(releases, new_releases, tolerance)
+
+
+def test_fast_forward_resolves_events_on_time(simulation):
+    checks, releases = due_times(simulation)
+    seconds = 3.0
+    end = simulation.clock.time + seconds
+
+    simulation.fast_forward(seconds)
+    assert simulation.clock.time == pytest.approx(end, abs=COARSE_DT)
+    new_checks, new_releases = due_times(simulation)
+    for before, after in ((checks, new_checks), (releases, new_releases)):
+        for uid, time in before.items():
+            if time < end - COARSE_DT:
+                # Due well within the coarse ticks: it happened (a reinfection is due much later)
+                assert uid not in after or after[uid] > end
+            elif uid in after:
+                # Still pending after the coarse ticks: at the same time as before
+                assert after[uid] == pytest.approx(time, abs=2 * COARSE_DT)
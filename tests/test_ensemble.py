@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from ensemble import HISTOGRAM_BINS, EnsembleSummary
+from recorder import STAT_FIELDS
+
+Q = (0, 5, 37.5, 50, 95, 100)
+
+
+def curves(replicates, steps, high, seed=0):
+    """Random integer replicate curves, with every field up to high."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, high, (replicates, steps, len(STAT_FIELDS))).astype(np.int32)
+
+
+def summarize(replicate_curves, order=None):
+    summary = EnsembleSummary({}, len(replicate_curves), replicate_curves.shape[1])
+    for replicate in order if order is not None else range(len(replicate_curves)):
+        summary.add(replicate, replicate_curves[replicate])
+    return summary
+
+
+def test_small_counts_are_summarized_exactly():
+    replicate_curves = curves(101, 30, HISTOGRAM_BINS)
+    summary = summarize(replicate_curves)
+
+    assert summary.completed == 101
+    assert np.all(summary.bin_width == 1)
+    assert np.allclose(summary.mean(), replicate_curves.mean(axis=0))
+    assert np.allclose(summary.percentiles(Q), np.percentile(replicate_curves, Q, axis=0))
+
+
+def test_large_counts_are_summarized_within_a_bin():
+    replicate_curves = curves(60, 30, 40 * HISTOGRAM_BINS)
+    # One replicate far out widens the bins of a single field only
+    replicate_curves[7, 3, 0] = 1000 * HISTOGRAM_BINS
+    summary = summarize(replicate_curves)
+
+    assert summary.histogram.shape == (30, len(STAT_FIELDS), HISTOGRAM_BINS)
+    assert summary.bin_width[0] == 1024 and np.all(summary.bin_width[1:] == 64)
+    assert np.allclose(summary.mean(), replicate_curves.mean(axis=0))
+    error = np.abs(summary.percentiles(Q) - np.percentile(replicate_curves, Q, axis=0))
+    assert np.all(error <= summary.bin_width)
+
+
+def test_summary_does_not_depend_on_arrival_order():
+    replicate_curves = curves(40, 20, 10 * HISTOGRAM_BINS)
+    summary = summarize(replicate_curves)
+    shuffled = summarize(replicate_curves, np.random.default_rng(1).permutation(40))
+
+    assert np.array_equal(shuffled.histogram, summary.histogram)
+    assert np.array_equal(shuffled.percentiles(Q), summary.percentiles(Q))
+
+
+def test_empty_summary():
+    summary = EnsembleSummary({}, 10, 5)
+
+    assert np.all(summary.mean() == 0)
+    assert np.all(np.isnan(summary.percentiles()))
+
+
+@pytest.mark.parametrize("replicates", [1, 2])
+def test_few_replicates(replicates):
+    replicate_curves = curves(replicates, 5, 20)
+
+    assert np.allclose(summarize(replicate_curves).percentiles(Q), np.percentile(replicate_curves, Q, axis=0))
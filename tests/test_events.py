@@ -0,0 +1,76 @@
+import numpy as np
+
+from epidemic_sim import Simulation
+from events import CONTACT_START, INFECTION, RECOVERY, EventLog, load_events, reproduction_numbers, transmission_tree
+
+# (tick, kind, agent, source): two seeded cases, a chain 0 -> 2 -> 3, agent 0 infected again by 1 and
+# passing it on once more, and an infection credited to an agent whose own infection is not logged
+LOG = [
+    (0, INFECTION, 0, -1),
+    (0, INFECTION, 1, -1),
+    (2, INFECTION, 2, 0),
+    (3, CONTACT_START, 3, 2),
+    (4, INFECTION, 3, 2),
+    (5, RECOVERY, 0, -1),
+    (6, INFECTION, 4, 0),
+    (7, INFECTION, 0, 1),
+    (8, INFECTION, 5, 0),
+    (9, INFECTION, 6, 7),
+]
+
+
+def write_log(path, records):
+    with EventLog(path) as log:
+        for tick, kind, agent, source in records:
+            log.log(tick, kind, agent, source, (agent, tick))
+    return load_events(path)
+
+
+def test_transmission_tree_links_each_infection_to_its_sources_latest_infection(tmp_path):
+    tree = transmission_tree(write_log(tmp_path / "events.bin", LOG))
+
+    assert tree["tick"].tolist() == [0, 0, 2, 4, 6, 7, 8, 9]
+    assert tree["agent"].tolist() == [0, 1, 2, 3, 4, 0, 5, 6]
+    assert tree["parent"].tolist() == [-1, -1, 0, 2, 0, 1, 5, -1]
+    assert tree["generation"].tolist() == [0, 0, 1, 2, 1, 1, 2, 0]
+    assert tree["offspring"].tolist() == [2, 1, 1, 0, 0, 1, 0, 0]
+
+
+def test_reproduction_numbers_average_offspring_per_bin(tmp_path):
+    events = write_log(tmp_path / "events.bin", LOG)
+
+    binned = reproduction_numbers(events, bin_ticks=4)
+    assert binned["tick"].tolist() == [0, 4, 8]
+    assert binned["infections"].tolist() == [3, 3, 2]
+    assert np.allclose(binned["R"], [4 / 3, 1 / 3, 0])
+
+    per_tick = reproduction_numbers(events)
+    assert per_tick["infections"].tolist() == [2, 0, 1, 0, 1, 0, 1, 1, 1, 1]
+    assert np.array_equal(per_tick["R"], [1.5, np.nan, 1, np.nan, 0, np.nan, 0, 1, 0, 0], equal_nan=True)
+
+
+def test_empty_log(tmp_path):
+    events = write_log(tmp_path / "events.bin", [])
+
+    assert len(transmission_tree(events)["parent"]) == 0
+    assert len(reproduction_numbers(events)["R"]) == 0
+
+
+def test_restart_keeps_runs_apart_in_a_shared_log(tmp_path):
+    with EventLog(tmp_path / "events.bin") as log:
+        simulation = Simulation(60, 10, seed=0, events=log)
+        simulation.step(300)
+        first_uid, boundary = simulation.next_uid, simulation.tick
+        simulation.restart()
+        simulation.step(300)
+    events = load_events(tmp_path / "events.bin")
+
+    assert np.all(np.diff(events["tick"]) >= 0)
+    second = events["tick"] >= boundary
+    assert np.any(second) and np.any(~second)
+    assert np.all(events["agent"][second] >= first_uid)
+    assert np.all(events["agent"][~second] < first_uid)
+
+    tree = transmission_tree(events)
+    linked = tree["parent"] >= 0
+    assert np.array_equal(tree["tick"][linked] >= boundary, tree["tick"][tree["parent"][linked]] >= boundary)
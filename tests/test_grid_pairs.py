@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from spatial import grid_pairs
+
+
+def all_pairs(points_a, points_b, radius, strict):
+    """Every (i, j) within radius (closer than radius if strict), from the full distance matrix."""
+    distance = np.hypot(points_a[:, None, 0] - points_b[None, :, 0], points_a[:, None, 1] - points_b[None, :, 1])
+    close = distance < radius if strict else distance <= radius
+    return set(zip(*np.nonzero(close)))
+
+
+def cases(count):
+    """Uniform point sets of many sizes, with a snapped variant so points sit on cell edges and coincide."""
+    rng = np.random.default_rng(0)
+    for case in range(count):
+        radius = float(rng.uniform(1, 50))
+        size = rng.uniform(10, 500)
+        points_a = rng.uniform(-size / 2, size, (int(rng.integers(1, 300)), 2))
+        points_b = rng.uniform(-size / 2, size, (int(rng.integers(1, 300)), 2))
+        if case % 3 == 0:
+            points_a, points_b = np.round(points_a / radius) * radius, np.round(points_b / radius) * radius
+        yield points_a, points_b, radius
+
+
+@pytest.mark.parametrize("strict", (False, True))
+@pytest.mark.parametrize("points_a, points_b, radius", list(cases(60)))
+def test_grid_pairs_match_all_pairs(points_a, points_b, radius, strict):
+    i, j, distance = grid_pairs(points_a, points_b, radius, strict=strict)
+
+    assert set(zip(i, j)) == all_pairs(points_a, points_b, radius, strict)
+    assert len(set(zip(i, j))) == len(i)
+    assert np.allclose(distance, np.hypot(*(points_a[i] - points_b[j]).T))
+
+
+@pytest.mark.parametrize("strict", (False, True))
+@pytest.mark.parametrize("points_a, points_b, radius", list(cases(60)))
+def test_grid_pairs_same_returns_each_pair_once(points_a, points_b, radius, strict):
+    i, j, distance = grid_pairs(points_a, points_a, radius, same=True, strict=strict)
+    expected = {(a, b) for a, b in all_pairs(points_a, points_a, radius, strict) if a < b}
+
+    assert set(zip(np.minimum(i, j), np.maximum(i, j))) == expected
+    assert len(i) == len(expected)
+    assert np.allclose(distance, np.hypot(*(points_a[i] - points_a[j]).T))
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from grouping import cluster
+
+
+def reference_clusters(points, radius):
+    """Single-linkage labels from every pair of points, with a plain union-find, numbered by first point."""
+    count = len(points)
+    parent = list(range(count))
+
+    def root(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    distance = np.hypot(points[:, None, 0] - points[None, :, 0], points[:, None, 1] - points[None, :, 1])
+    for i, j in zip(*np.nonzero(np.triu(distance < radius, 1))):
+        parent[root(i)] = root(j)
+
+    numbers = {}
+    return np.array([numbers.setdefault(root(node), len(numbers)) for node in range(count)], dtype=np.intp)
+
+
+def random_cases(count):
+    """Uniform and clumped point sets of many sizes and densities, with radii around their spacing."""
+    rng = np.random.default_rng(0)
+    for case in range(count):
+        n = int(rng.integers(1, 300))
+        if case % 2:
+            centers = rng.uniform(0, 1000, (int(rng.integers(1, 8)), 2))
+            points = centers[rng.integers(0, len(centers), n)] + rng.normal(0, rng.uniform(5, 80), (n, 2))
+        else:
+            points = rng.uniform(0, rng.uniform(50, 2000), (n, 2))
+        yield points, float(rng.uniform(5, 150))
+
+
+def lattice_cases():
+    """Points exactly on, just inside and just outside the radius of each other, plus duplicates."""
+    grid = np.stack(np.meshgrid(np.arange(12.0), np.arange(9.0)), axis=-1).reshape(-1, 2)
+    for spacing in (10.0, 10.0 * (1 - 1e-12), 10.0 * (1 + 1e-12), 10.0 / np.sqrt(2), 7.0, 14.2):
+        for angle in (0.0, 0.3, np.pi / 4):
+            rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+            yield grid * spacing @ rotation.T - 37.5, 10.0
+    yield np.zeros((5, 2)), 10.0
+    yield np.array([[0.0, 0.0], [10.0, 0.0], [20.0, 0.0], [29.999, 0.0]]), 10.0
+    yield np.array([[3.0, 4.0]]), 1.0
+
+
+@pytest.mark.parametrize("points, radius", list(random_cases(300)) + list(lattice_cases()))
+def test_cluster_matches_all_pairs(points, radius):
+    labels, sizes, centers = cluster(points, radius)
+    expected = reference_clusters(points, radius)
+
+    assert np.array_equal(labels, expected)
+    assert np.array_equal(sizes, np.bincount(expected))
+    for label, center in enumerate(centers):
+        assert np.allclose(center, points[expected == label].mean(axis=0))
@@ -0,0 +1,28 @@
+import numpy as np
+
+import epidemic_sim
+from meanfield import MeanFieldModel
+from population import ArrayPopulation
+from recorder import STAT_FIELDS
+
+# Default horizon, in frames: the 4000 ticks the agent engines take for the default epidemic
+HORIZON = 4000
+SEEDS = 8
+
+
+def test_meanfield_follows_the_mean_of_seeded_array_runs():
+    """With the default setup, the mean-field infected, cumulative infection and death curves stay within 20%
+    of the population of the mean of 8 seeded ArrayPopulation runs at every step, and within 8% RMS."""
+    runs = np.mean([ArrayPopulation(seed=seed).run_steps(HORIZON) for seed in range(SEEDS)], axis=0)
+    model = MeanFieldModel()
+    steps = model.clock.steps(HORIZON * model.clock.frame)
+    expected = model.run_steps(steps)
+    # The array row covering the same simulated time as each mean-field step
+    rows = np.minimum(np.round(np.arange(1, steps + 1) * model.clock.frames).astype(int), HORIZON) - 1
+
+    population = epidemic_sim.no_agents
+    for field in ("infected", "infection_rate", "death_count"):
+        column = STAT_FIELDS.index(field)
+        error = expected[:, column] - runs[rows, column]
+        assert np.abs(error).max() < 0.2 * population, field
+        assert np.sqrt(np.mean(error ** 2)) < 0.08 * population, field
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import epidemic_sim
+from epidemic_sim import Simulation
+from meanfield import MeanFieldModel
+from population import ArrayPopulation
+
+ZONE = (300, 200, 150, 120, 6)
+
+
+@pytest.fixture
+def layout(monkeypatch):
+    """A default layout with a small zone that fills up, and non-default avoidance."""
+    monkeypatch.setattr(epidemic_sim, "default_quarantine_zones", (ZONE, (50, 50, 100, 100, None)))
+    monkeypatch.setattr(epidemic_sim, "quarantine_avoidance_radius", 120)
+    monkeypatch.setattr(epidemic_sim, "quarantine_avoidance_strength", 3)
+
+
+def test_engines_share_the_default_layout(layout):
+    width, height = epidemic_sim.SCREEN_WIDTH + 400, epidemic_sim.SCREEN_HEIGHT + 100
+    simulation = Simulation(20, 2, seed=0, width=width, height=height)
+    population = ArrayPopulation(200, 10, width, height, seed=0)
+    model = MeanFieldModel(200, 10, width, height)
+
+    zone = simulation.quarantine_zones[0]
+    assert len(simulation.quarantine_zones) == 2
+    assert tuple(zone.rect) == population.quarantine_rect == (ZONE[0] + 400, ZONE[1] + 100, ZONE[2], ZONE[3])
+    assert zone.capacity == population.quarantine_capacity == model.quarantine_capacity == ZONE[4]
+    assert zone.avoidance_radius == population.avoidance_radius == 120
+    assert zone.avoidance_strength == population.avoidance_strength == 3
+
+
+def test_array_engines_keep_to_the_zone_capacity(layout):
+    population = ArrayPopulation(2000, 200, seed=0)
+    entered = 0
+    for _ in range(1500):
+        population.step()
+        assert np.count_nonzero(population.in_quarantine) <= ZONE[4]
+        entered = max(entered, np.count_nonzero(population.in_quarantine))
+    assert entered == ZONE[4]
+
+    model = MeanFieldModel(2000, 200, dt=None)
+    for _ in range(1500):
+        model.step()
+        assert model.quarantined.sum() <= ZONE[4] + 1e-9
+
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+import data
+
+
+def write_sources(directory, confirmed=90, recovered=6, deaths=4):
+    """Small epidemic, vaccination and population CSVs for two regions; returns their paths."""
+    paths = {name: os.path.join(directory, f"{name}.csv") for name in ("epidemic", "vaccination", "population")}
+    with open(paths["epidemic"], "w") as file:
+        file.write("Case Type,Count,Country/Region\n")
+        file.write(f"Confirmed,{confirmed},France\nRecovered,{recovered},France\nDeaths,{deaths},France\n")
+        file.write("Confirmed,30,Japan\nRecovered,10,Japan\n")
+    with open(paths["vaccination"], "w") as file:
+        file.write("location,people_vaccinated\nFrance,50\nFrance,60\nJapan,20\n")
+    with open(paths["population"], "w") as file:
+        file.write("Country/Territory,2020 Population,2022 Population\nFrance,100,140\nJapan,80,80\n")
+    return paths
+
+
+def load(paths, cache):
+    return data.load_region_table(paths["epidemic"], paths["vaccination"], paths["population"], cache)
+
+
+def rates(table, name):
+    i = table["index"][name]
+    return tuple(float(table[column][i]) for column in ("infection_rate", "recovery_rate", "vaccination_rate"))
+
+
+def test_cache_is_read_back_when_the_sources_match(tmp_path, monkeypatch):
+    paths, cache = write_sources(tmp_path), str(tmp_path / "cache" / "rates.npz")
+    expected = rates(load(paths, cache), "France")
+    assert expected == pytest.approx((0.9, 6 / 90, 0.5))
+    assert os.listdir(tmp_path / "cache") == ["rates.npz"]
+
+    data._cached_region_table.cache_clear()
+    monkeypatch.setattr(data, "build_region_table", lambda *paths: pytest.fail("cache was not used"))
+    assert rates(load(paths, cache), "France") == expected
+
+
+def test_cache_is_rebuilt_when_a_source_changes(tmp_path):
+    paths, cache = write_sources(tmp_path), str(tmp_path / "rates.npz")
+    load(paths, cache)
+
+    write_sources(tmp_path, confirmed=180, recovered=18, deaths=2)
+    assert rates(load(paths, cache), "France") == pytest.approx((0.9, 0.1, 0.5))
+    with np.load(cache) as cached:
+        assert tuple(cached["signature"]) == data.source_signature(
+            paths["epidemic"], paths["vaccination"], paths["population"])
+
+
+@pytest.mark.parametrize("contents", [b"", b"not a zip file", "truncated"])
+def test_corrupt_cache_is_rebuilt(tmp_path, contents):
+    paths, cache = write_sources(tmp_path), str(tmp_path / "rates.npz")
+    expected = rates(load(paths, cache), "France")
+    if contents == "truncated":
+        with open(cache, "rb") as file:
+            contents = file.read()[:-40]
+    with open(cache, "wb") as file:
+        file.write(contents)
+
+    data._cached_region_table.cache_clear()
+    assert rates(load(paths, cache), "France") == expected
+    with np.load(cache) as cached:
+        table = {name: cached[name] for name in cached.files}
+    table["index"] = {name: i for i, name in enumerate(table["regions"])}
+    assert rates(table, "France") == expected
+    assert sorted(os.listdir(tmp_path)) == ["epidemic.csv", "population.csv", "rates.npz", "vaccination.csv"]
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from epidemic_sim import Simulation
+from helpers import ZONES, agent_state
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_grid_matches_full_scan(seed):
+    """The spatial grid only narrows down the candidates, so indexed and full-scan runs agree exactly."""
+    indexed = Simulation(200, 20, seed=seed, quarantine_zones=ZONES, spatial_index=True)
+    scanned = Simulation(200, 20, seed=seed, quarantine_zones=ZONES, spatial_index=False)
+    indexed.step(600)
+    scanned.step(600)
+
+    assert np.array_equal(indexed.stats, scanned.stats)
+    expected, actual = agent_state(indexed), agent_state(scanned)
+    for name in expected:
+        assert np.array_equal(expected[name], actual[name]), name
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from epidemic_sim import SimulationConfig
+from population import AGENT_ARRAYS, DEAD
+from recorder import STAT_FIELDS
+from tiling import TiledPopulation
+
+# Coarse ticks, so agents cross tile edges and spread the infection over the whole world within a few hundred
+DT = 0.25
+# With every agent anti-vax nobody groups, and at 36 frames a tick any contact infects (the escape chance
+# rounds to 0) and every infection ends in a recovery: no outcome depends on the random streams, which
+# differ between tilings as each tile draws from its own
+CERTAIN = SimulationConfig(infection_probability=0.8, recovery_probability=1, vaccination_rate=0)
+
+
+def tile_of(population):
+    """The tile each agent is in, as the workers assign them."""
+    columns, rows = population.tiles
+    column = np.minimum((population.position[:, 0] / (population.width / columns)).astype(int), columns - 1)
+    row = np.minimum((population.position[:, 1] / (population.height / rows)).astype(int), rows - 1)
+    return row * columns + column
+
+
+def test_tiled_run_keeps_every_agent():
+    with TiledPopulation(2000, 20, seed=0, tiles=(2, 2), dt=DT) as population:
+        start = tile_of(population)
+        crossed = border = 0
+        for _ in range(20):
+            population.step(10)
+            # Every living agent is owned by exactly one tile
+            assert population.views["owned_counts"].sum() == np.count_nonzero(population.state != DEAD)
+            crossed = max(crossed, np.count_nonzero(tile_of(population) != start))
+            border += population.views["mail_counts"][:, 1].sum()
+        stats = population.stats
+
+    assert crossed > 0 and border > 0
+    assert stats[:, STAT_FIELDS.index("death_count")].max() > 0
+    alive = stats[:, :3].sum(axis=1) + stats[:, STAT_FIELDS.index("death_count")]
+    assert np.all(alive == 2000)
+
+
+@pytest.mark.parametrize("tiles", [(2, 2), (3, 1)])
+def test_tiled_run_matches_a_single_tile(tiles):
+    """Without random outcomes, the halo and the migrations reproduce a single-tile run exactly."""
+    runs = []
+    for grid in ((1, 1), tiles):
+        with TiledPopulation(1000, 10, seed=4, tiles=grid, config=CERTAIN, dt=DT) as population:
+            start = tile_of(population)
+            population.step(160)
+            crossed = np.count_nonzero(tile_of(population) != start)
+            runs.append((population.stats, {name: np.array(getattr(population, name)) for name in AGENT_ARRAYS}))
+
+    (single, single_agents), (tiled, tiled_agents) = runs
+    assert crossed > 0
+    # The infection went round the whole population several times
+    assert single[-1, STAT_FIELDS.index("infection_rate")] > 2000
+    assert np.array_equal(tiled, single)
+    for name in AGENT_ARRAYS:
+        assert np.array_equal(tiled_agents[name], single_agents[name]), name